@@ -1,50 +1,240 @@
-from copy import deepcopy
+from abc import ABCMeta, abstractmethod
+from itertools import chain
+from operator import attrgetter
+import os
+import time
 import numpy as np
 
 from BeeGraduater import EmployeeGraduaterBee, OnlookerGradueterBee
+from checkpoint import config_fingerprint, load_checkpoint, save_checkpoint
+from profiling import NullProfiler, PhaseProfiler
 
-class ABC(object):
 
-    def __init__(self, obj_function, colony_size=30, n_iter=5000, max_trials=100, suppress_output=False):
+def roulette_select(wheel, n, rng):
+    '''
+    Fitness-proportional selection with a binary search per draw
+    Args:
+        wheel (np.array): cumulative selection probabilities of the food sources
+        n (int): number of draws
+        rng (np.random.Generator)
+    Returns:
+        np.array: indices of the selected food sources, uniform if every probability is zero
+    '''
+    if not wheel[-1] > 0:
+        return rng.integers(len(wheel), size=n)
+    draws = rng.uniform(low=0, high=wheel[-1], size=n)
+    return np.minimum(np.searchsorted(wheel, draws, side='right'), len(wheel) - 1)
+
+
+class EliteSolution(object):
+    '''
+    Snapshot of a food source: a copy of its position with its fitness, std
+    and the iteration it was recorded at
+    '''
+
+    __slots__ = ('pos', 'fitness', 'std', 'iteration')
+
+    def __init__(self, pos, fitness, std, iteration):
+        self.pos = np.array(pos, copy=True)
+        self.fitness = fitness
+        self.std = std
+        self.iteration = iteration
+
+    @classmethod
+    def from_bee(cls, bee, iteration):
+        return cls(bee.pos, bee.fitness, bee.std, iteration)
+
+
+class StoppingRules(object):
+    '''
+    Optional early termination rules for a colony run.
+
+    Attributes:
+        patience (int): stop after this many iterations without improvement
+        tol (float): relative improvement of the best fitness that still
+            counts as improvement for patience
+        max_time (float): wall-clock budget in seconds
+        max_evaluations (int): objective evaluation budget
+    '''
+
+    __slots__ = ('patience', 'tol', 'max_time', 'max_evaluations',
+                 'start_time', 'start_evaluations', 'best_fitness', 'stalled')
+
+    def __init__(self, patience=None, tol=0.0, max_time=None, max_evaluations=None):
+        if tol and patience is None:
+            raise ValueError(f"tol={tol} only qualifies improvements counted by patience, set patience as well")
+        self.patience = patience
+        self.tol = tol
+        self.max_time = max_time
+        self.max_evaluations = max_evaluations
+
+    def start(self, obj_function):
+        self.start_time = time.perf_counter()
+        self.start_evaluations = obj_function.evaluations
+        self.best_fitness = None
+        self.stalled = 0
+
+    def state(self, obj_function):
+        '''
+        Returns:
+            dict: progress of the rules, saved with colony checkpoints
+        '''
+        return {'stopping_best_fitness': np.nan if self.best_fitness is None else self.best_fitness,
+                'stopping_stalled': self.stalled,
+                'stopping_elapsed': time.perf_counter() - self.start_time,
+                'stopping_evaluations': obj_function.evaluations - self.start_evaluations}
+
+    def restore(self, state, obj_function):
+        '''Continues the budgets and patience of a checkpointed run'''
+        best_fitness = float(state['stopping_best_fitness'])
+        self.best_fitness = None if np.isnan(best_fitness) else best_fitness
+        self.stalled = int(state['stopping_stalled'])
+        self.start_time = time.perf_counter() - float(state['stopping_elapsed'])
+        self.start_evaluations = obj_function.evaluations - int(state['stopping_evaluations'])
+
+    def check(self, fitness, obj_function):
+        '''
+        Args:
+            fitness (float): best fitness after the current iteration
+        Returns:
+            str: reason to stop, None to continue
+        '''
+        if self.patience is not None:
+            if self.best_fitness is None or fitness - self.best_fitness > self.tol*abs(self.best_fitness):
+                self.best_fitness = fitness
+                self.stalled = 0
+            else:
+                self.stalled += 1
+                if self.stalled >= self.patience:
+                    return 'patience'
+        if self.max_time is not None and time.perf_counter() - self.start_time >= self.max_time:
+            return 'max_time'
+        if self.max_evaluations is not None and \
+           obj_function.evaluations - self.start_evaluations >= self.max_evaluations:
+            return 'max_evaluations'
+        return None
+
+
+class BaseBeeColony(metaclass=ABCMeta):
+    '''
+    Driver shared by the colony engines: start, step, finish, optimize,
+    checkpoints, stopping rules, profiling, callbacks and best solution
+    tracking. Engines implement the colony storage and the phases.
+    '''
+
+    def __init__(self, obj_function, colony_size=30, n_iter=5000, max_trials=100, callbacks=(),
+                 patience=None, tol=0.0, max_time=None, max_evaluations=None, profile=False, rng=None):
         self.colony_size = colony_size
         self.obj_function = obj_function
+        # one stream with the objective's samplers unless a separate one is given
+        self.rng = obj_function.rng if rng is None else np.random.default_rng(rng)
 
         self.n_iter = n_iter
         self.max_trials = max_trials
+        self.stopping = StoppingRules(patience, tol, max_time, max_evaluations)
+        self.profile = profile
+        self.profiler = PhaseProfiler() if profile else NullProfiler()
+        self.stop_reason = None
+        self.stop_iter = None
 
         self.optimal_solution = None
         self.prev_optimal_solution = None
         self.optimal_solution_iter = 0
-        self.optimality_tracking = []
+        self.optimality_tracking = np.empty(0)
 
-        self.employee_bees = []
-        self.onlokeer_bees = []
+        self.wheel = None
+        self.best_food_sources = None
+
+        self.callbacks = tuple(callbacks)
+
+    @abstractmethod
+    def _initialize_colony(self, initial_positions):
+        '''Creates the colony, see start'''
+
+    @abstractmethod
+    def _colony_state(self):
+        '''
+        Returns:
+            dict: positions, fitness, std and trials of every bee, employees first
+        '''
+
+    @abstractmethod
+    def _restore_colony(self, state):
+        '''Recreates the colony from the arrays of _colony_state'''
+
+    @abstractmethod
+    def _best_food_source(self):
+        '''
+        Returns:
+            tuple: position, fitness and std of the fittest bee
+        '''
+
+    @abstractmethod
+    def _reset_colony(self):
+        '''Moves every bee to a new random food source'''
 
-        self.suppress_output = suppress_output
+    @abstractmethod
+    def _employee_bees_phase(self):
+        pass
 
-    def __reset_algorithm(self):
+    @abstractmethod
+    def _calculate_probabilities(self):
+        '''Sets the cumulative selection probabilities of the employee food sources in wheel'''
+
+    @abstractmethod
+    def _select_best_food_sources(self):
+        '''Draws the food source of every onlooker into best_food_sources'''
+
+    @abstractmethod
+    def _onlooker_bees_phase(self):
+        pass
+
+    @abstractmethod
+    def _scout_bees_phase(self):
+        pass
+
+    def _reset_algorithm(self):
         self.optimal_solution = None
-        self.optimality_tracking = []
+        self.optimality_tracking = np.empty(self.n_iter)
+        self.stop_reason = 'n_iter'
+        self.stop_iter = self.n_iter
+        self.stopping.start(self.obj_function)
+        self.profiler.start(self.obj_function)
 
-    def __update_optimality_tracking(self):
-        self.optimality_tracking.append(self.optimal_solution.fitness)
+    def _rngs(self):
+        return {'rng': self.rng, 'objective_rng': self.obj_function.rng}
 
-    def __update_optimal_solution(self, iter_, compare_to_prev: bool):
-        n_optimal_solution = \
-            max(self.onlokeer_bees + self.employee_bees,
-                key=lambda bee: bee.fitness)
+    def fingerprint(self):
+        '''
+        Returns:
+            str: hash of the objective and colony settings a checkpoint is only valid for
+        '''
+        return config_fingerprint({'objective': self.obj_function.config(), 'colony_size': self.colony_size,
+                                   'n_iter': self.n_iter, 'max_trials': self.max_trials})
+
+    def _notify(self, event, *args):
+        for callback in self.callbacks:
+            getattr(callback, event)(self, *args)
+
+    def _update_optimality_tracking(self, iter_):
+        self.optimality_tracking[iter_] = self.optimal_solution.fitness
+
+    def _update_optimal_solution(self, iter_, compare_to_prev: bool):
+        pos, fitness, std = self._best_food_source()
         if iter_ == 1:
             self.prev_optimal_solution = self.optimal_solution
 
-        if not self.optimal_solution:
-            self.optimal_solution = deepcopy(n_optimal_solution)
+        if self.optimal_solution is None:
+            self.optimal_solution = EliteSolution(pos, fitness, std, iter_)
+            self._notify('on_improvement', iter_, self.optimal_solution)
         else:
 
             if (self.optimal_solution_iter == self.obj_function.max_iter) and \
                ((self.n_iter -  iter_) / self.n_iter) > 0.1:
-                self.__reset_bees()
-            elif (n_optimal_solution.fitness > self.optimal_solution.fitness) and (sum(n_optimal_solution.pos) < self.obj_function.td):
-                self.optimal_solution = deepcopy(n_optimal_solution)
+                self._reset_bees(iter_)
+            elif (fitness > self.optimal_solution.fitness) and (np.sum(pos) < self.obj_function.td):
+                self.optimal_solution = EliteSolution(pos, fitness, std, iter_)
+                self._notify('on_improvement', iter_, self.optimal_solution)
 
             if compare_to_prev and iter_ > 0:
 
@@ -53,68 +243,250 @@ class ABC(object):
                 else:
                     self.optimal_solution_iter = 0
 
-                self.prev_optimal_solution = deepcopy(self.optimal_solution)
+                # snapshots are never modified, so the previous best can share it
+                self.prev_optimal_solution = self.optimal_solution
+
+    def _reset_bees(self, iter_):
+        self.optimal_solution_iter = 0
+        self._reset_colony()
+        self.profiler.count('colony_resets')
+        self._notify('on_reset', iter_)
+        colony = self._colony_state()
+        feasible = np.flatnonzero(colony['positions'].sum(axis=1) < self.obj_function.td)
+        if feasible.size:
+            row = self.rng.choice(feasible)
+            self.optimal_solution = EliteSolution(colony['positions'][row], colony['fitness'][row],
+                                                  colony['std'][row], iter_)
+
+    def start(self, initial_positions=None):
+        '''
+        Resets the algorithm and initializes the colony
+        Args:
+            initial_positions (np.array): (k x dim) positions of the first bees, employees first;
+                infeasible rows are dropped and the remaining bees are sampled
+        '''
+        self._reset_algorithm()
+        self._initialize_colony(initial_positions)
+        self._notify('on_start')
+
+    def step(self, itr):
+        '''
+        Runs a single iteration of the colony
+        Args:
+            itr (int): iteration number
+        Returns:
+            bool: True if a stopping rule ended the run
+        '''
+        with self.profiler.phase('employee'):
+            self._employee_bees_phase()
+        with self.profiler.phase('optimal_update'):
+            self._update_optimal_solution(itr, compare_to_prev=False)
+
+        with self.profiler.phase('probabilities'):
+            self._calculate_probabilities()
+        with self.profiler.phase('selection'):
+            self._select_best_food_sources()
+
+        with self.profiler.phase('onlooker'):
+            self._onlooker_bees_phase()
+        with self.profiler.phase('scout'):
+            self._scout_bees_phase()
+
+        with self.profiler.phase('optimal_update'):
+            self._update_optimal_solution(itr, compare_to_prev=True)
+        self._update_optimality_tracking(itr)
+        self._notify('on_iteration', itr)
+
+        reason = self.stopping.check(self.optimal_solution.fitness, self.obj_function)
+        if reason:
+            self.stop_reason, self.stop_iter = reason, itr + 1
+            return True
+        return False
+
+    def finish(self):
+        '''
+        Returns:
+            tuple: optimal fitness, position and std, plus the profile if enabled
+        '''
+        self.optimality_tracking = self.optimality_tracking[:self.stop_iter]
+        self._notify('on_end')
+        result = self.optimal_solution.fitness, self.optimal_solution.pos, self.optimal_solution.std
+        if self.profile:
+            return result + (self.profiler.report(self.obj_function, self.stop_iter),)
+        return result
+
+    def checkpoint(self, path, iteration):
+        '''
+        Saves the colony, the best solution, the stopping rules progress, the
+        objective counters and the random streams after the given number of
+        completed iterations
+        '''
+        save_checkpoint(path, self._rngs(), config=self.fingerprint(), iteration=iteration, **self._colony_state(),
+                        best_pos=self.optimal_solution.pos, best_fitness=self.optimal_solution.fitness,
+                        best_std=self.optimal_solution.std, best_iteration=self.optimal_solution.iteration,
+                        optimal_solution_iter=self.optimal_solution_iter,
+                        tracking=self.optimality_tracking[:iteration],
+                        stop_reason=self.stop_reason, stop_iter=self.stop_iter,
+                        **self.obj_function.counters(), **self.stopping.state(self.obj_function))
 
-    def __initialize_employees(self):
+    def restore(self, path):
+        '''
+        Restores a colony saved by checkpoint, which must have been saved
+        with the same objective, dimension, colony_size, n_iter and max_trials
+        Returns:
+            int: iteration the run continues from
+        '''
+        state = load_checkpoint(path, self._rngs(), config=self.fingerprint())
+        self.obj_function.restore_counters(state)
+
+        self._reset_algorithm()
+        self._restore_colony(state)
+
+        self.optimal_solution = EliteSolution(state['best_pos'], float(state['best_fitness']),
+                                              float(state['best_std']), int(state['best_iteration']))
+        self.prev_optimal_solution = self.optimal_solution
+        self.optimal_solution_iter = int(state['optimal_solution_iter'])
+        iteration = int(state['iteration'])
+        self.optimality_tracking[:iteration] = state['tracking']
+        self.stop_reason, self.stop_iter = str(state['stop_reason']), int(state['stop_iter'])
+        self.stopping.restore(state, self.obj_function)
+        self._notify('on_start')
+        return iteration
+
+    def optimize(self, initial_positions=None, checkpoint=None, checkpoint_every=None):
+        '''
+        Args:
+            initial_positions (np.array): warm start positions, see start
+            checkpoint (str): checkpoint file, the run resumes from it if it exists
+                and saves its final state to it
+            checkpoint_every (int): iterations between intermediate checkpoints
+        Returns:
+            tuple: optimal fitness, position and std, plus the profile if enabled
+        '''
+        if checkpoint is not None and os.path.exists(checkpoint):
+            first = self.restore(checkpoint)
+        else:
+            self.start(initial_positions)
+            first = 0
+        for itr in range(first, self.stop_iter):
+            if self.step(itr):
+                break
+            if checkpoint is not None and checkpoint_every and (itr + 1) % checkpoint_every == 0:
+                self.checkpoint(checkpoint, itr + 1)
+        if checkpoint is not None:
+            self.checkpoint(checkpoint, self.stop_iter)
+        return self.finish()
+
+
+class ABC(BaseBeeColony):
+    '''
+    Artificial bee colony of bee objects, see BaseGraduaterBee
+    '''
+
+    def __init__(self, obj_function, colony_size=30, n_iter=5000, max_trials=100, callbacks=(),
+                 patience=None, tol=0.0, max_time=None, max_evaluations=None, profile=False, rng=None):
+        super().__init__(obj_function, colony_size, n_iter, max_trials, callbacks,
+                         patience, tol, max_time, max_evaluations, profile, rng)
+        self.employee_bees = []
+        self.onlokeer_bees = []
+        self.best_food_sources = []
+
+    def _best_food_source(self):
+        bee = max(chain(self.onlokeer_bees, self.employee_bees), key=attrgetter('fitness'))
+        return bee.pos, bee.fitness, bee.std
+
+    def __initialize_employees(self, positions):
         for _ in range(self.colony_size // 2):
-            self.employee_bees.append(EmployeeGraduaterBee(self.obj_function))
+            self.employee_bees.append(EmployeeGraduaterBee(self.obj_function, next(positions, None)))
 
-    def __initialize_onlookers(self):
+    def __initialize_onlookers(self, positions):
         for _ in range(self.colony_size // 2):
-            self.onlokeer_bees.append(OnlookerGradueterBee(self.obj_function))
+            self.onlokeer_bees.append(OnlookerGradueterBee(self.obj_function, next(positions, None)))
 
-    def __reset_bees(self):
-        self.optimal_solution_iter = 0
+    def _initialize_colony(self, initial_positions):
+        self.employee_bees = []
+        self.onlokeer_bees = []
+        positions = iter(())
+        if initial_positions is not None:
+            initial_positions = np.asarray(initial_positions, dtype=float)
+            positions = iter(initial_positions[self.obj_function.is_feasible(initial_positions)])
+        self.__initialize_employees(positions)
+        self.__initialize_onlookers(positions)
+
+    def _colony_state(self):
+        bees = self.employee_bees + self.onlokeer_bees
+        return {'positions': np.array([bee.pos for bee in bees]),
+                'fitness': np.array([bee.fitness for bee in bees]),
+                'std': np.array([bee.std for bee in bees]),
+                'trials': np.array([bee.trial for bee in bees])}
+
+    def _restore_colony(self, state):
+        n_employees = self.colony_size // 2
+        bees = [(OnlookerGradueterBee if i >= n_employees else EmployeeGraduaterBee).from_state(
+                    self.obj_function, pos, fitness, std, int(trial))
+                for i, (pos, fitness, std, trial) in
+                enumerate(zip(state['positions'], state['fitness'], state['std'], state['trials']))]
+        self.employee_bees, self.onlokeer_bees = bees[:n_employees], bees[n_employees:]
+
+    def _reset_colony(self):
         list(map(lambda bee: bee.force_reset_bee(), self.employee_bees + self.onlokeer_bees))
-        while True:
-            possible_solution = np.random.choice(self.employee_bees + self.onlokeer_bees)
-            if sum(possible_solution.pos) < self.obj_function.td:
-                self.optimal_solution = possible_solution
-                return
-
-
-    def __employee_bees_phase(self):
-        list(map(lambda bee: bee.explore(self.max_trials), self.employee_bees))
-
-    def __calculate_probabilities(self):
-        sum_fitness = sum(map(lambda bee: bee.get_fitness(), self.employee_bees))
-        list(map(lambda bee: bee.compute_prob(sum_fitness), self.employee_bees))
-
-    def __select_best_food_sources(self):
-        self.best_food_sources =\
-            list(filter(lambda bee: bee.prob > np.random.uniform(low=0, high=1),
-                   self.employee_bees))
-        while not self.best_food_sources:
-            self.best_food_sources = \
-                list(filter(lambda bee: bee.prob > np.random.uniform(low=0, high=1),
-                       self.employee_bees))
-
-    def __onlooker_bees_phase(self):
-        list(map(lambda bee: bee.onlook(self.best_food_sources, self.max_trials),
-            self.onlokeer_bees))
-
-    def __scout_bees_phase(self):
-        list(map(lambda bee: bee.reset_bee(self.max_trials),
+
+    def __draw_moves(self, n, phi_bounds):
+        '''
+        Draws the step component and integer multipliers of n moves at once
+        Returns:
+            tuple(np.array, np.array): component indices and (n x dim) multipliers
+        '''
+        dim = self.obj_function.dim
+        components = self.rng.integers(dim, size=n)
+        phis = self.rng.uniform(low=phi_bounds[0], high=phi_bounds[1], size=(n, dim)).astype(int)
+        return components, phis
+
+    def _employee_bees_phase(self):
+        components, phis = self.__draw_moves(len(self.employee_bees), EmployeeGraduaterBee.PHI_BOUNDS)
+        list(map(lambda bee, component, phi: bee.explore(self.max_trials, component, phi),
+            self.employee_bees, components, phis))
+
+    def _calculate_probabilities(self):
+        fitness = np.fromiter(map(lambda bee: bee.get_fitness(), self.employee_bees),
+                              dtype=float, count=len(self.employee_bees))
+        # negative fitness is shifted so that the worst food source gets zero probability
+        offset = min(fitness.min(), 0.0)
+        sum_fitness = (fitness - offset).sum()
+        list(map(lambda bee: bee.compute_prob(sum_fitness, offset), self.employee_bees))
+        self.wheel = np.cumsum([bee.prob for bee in self.employee_bees])
+
+    def _select_best_food_sources(self):
+        '''Draws the food source of every onlooker bee at once'''
+        self.best_food_sources = [self.employee_bees[i] for i in
+                                  roulette_select(self.wheel, len(self.onlokeer_bees), self.rng)]
+
+    def _onlooker_bees_phase(self):
+        components, phis = self.__draw_moves(len(self.onlokeer_bees), OnlookerGradueterBee.PHI_BOUNDS)
+        list(map(lambda bee, source, component, phi: bee.onlook(source, self.max_trials, component, phi),
+            self.onlokeer_bees, self.best_food_sources, components, phis))
+
+    def _scout_bees_phase(self):
+        resets = sum(map(lambda bee: bee.reset_bee(self.max_trials),
             self.onlokeer_bees + self.employee_bees))
+        self.profiler.count('resets', resets)
+
+    def migrate(self, pos, fitness, std):
+        '''
+        Replaces the worst employee food source with a migrant food source,
+        if the migrant is better
+        '''
+        worst = min(self.employee_bees, key=attrgetter('fitness'))
+        if fitness > worst.fitness:
+            worst.pos = np.array(pos, copy=True)
+            worst.fitness = fitness
+            worst.std = std
+            worst.trial = 0
 
-    def optimize(self):
-        self.__reset_algorithm()
-        self.__initialize_employees()
-        self.__initialize_onlookers()
-        for itr in range(self.n_iter):
-            self.__employee_bees_phase()
-            self.__update_optimal_solution(itr, compare_to_prev=False)
-
-            self.__calculate_probabilities()
-            self.__select_best_food_sources()
-
-            self.__onlooker_bees_phase()
-            self.__scout_bees_phase()
-
-            self.__update_optimal_solution(itr, compare_to_prev=True)
-            self.__update_optimality_tracking()
-            if not self.suppress_output:
-                print(self.optimal_solution.pos)
-                print("iter: {} = cost: {}"
-                    .format(itr, self.optimal_solution.fitness))
-        return self.optimal_solution.fitness, self.optimal_solution.pos, self.optimal_solution.std
+    def elite_positions(self, n):
+        '''
+        Returns:
+            np.array: (n x dim) positions of the n fittest bees, best first
+        '''
+        bees = sorted(chain(self.employee_bees, self.onlokeer_bees), key=attrgetter('fitness'), reverse=True)
+        return np.array([bee.pos for bee in bees[:n]])
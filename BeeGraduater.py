@@ -1,17 +1,22 @@
 '''Bees'''
 
 from abc import ABC
-from copy import deepcopy
 import numpy as np
 
 class BaseGraduaterBee(ABC):
     '''Base bee class'''
 
+    __slots__ = ('pos', 'obj_function', 'minf', 'maxf', 'maxl', 'fitness', 'std', 'trial', 'prob')
+
     TRIAL_INITIAL_DEFAULT_VALUE = 0
     INTIAL_DEFAULT_PROBABILITY = 0.0
 
-    def __init__(self, obj_function):
-        self.pos = obj_function.custom_sample()
+    def __init__(self, obj_function, pos=None):
+        '''
+        Args:
+            pos (np.array): initial food source, sampled if None
+        '''
+        self.pos = obj_function.custom_sample() if pos is None else np.array(pos, copy=True)
         self.obj_function = obj_function
         self.minf = obj_function.minf
         self.maxf = obj_function.maxf
@@ -20,6 +25,20 @@ class BaseGraduaterBee(ABC):
         self.trial = BaseGraduaterBee.TRIAL_INITIAL_DEFAULT_VALUE
         self.prob = BaseGraduaterBee.INTIAL_DEFAULT_PROBABILITY
 
+    @classmethod
+    def from_state(cls, obj_function, pos, fitness, std, trial):
+        '''Rebuilds a checkpointed bee without evaluating its food source'''
+        bee = cls.__new__(cls)
+        bee.pos = np.array(pos, copy=True)
+        bee.obj_function = obj_function
+        bee.minf = obj_function.minf
+        bee.maxf = obj_function.maxf
+        bee.maxl = obj_function.maxl
+        bee.fitness, bee.std = fitness, std
+        bee.trial = trial
+        bee.prob = BaseGraduaterBee.INTIAL_DEFAULT_PROBABILITY
+        return bee
+
     def evaluate_boundaries(self, pos):
         '''
         Checks whether food is within boundaries,
@@ -33,7 +52,8 @@ class BaseGraduaterBee(ABC):
         if pos[1] > self.maxl:
             pos[1] = self.maxl
         if pos[2]*self.obj_function.salary < self.obj_function.min_income:
-            pos[2] = self.obj_function.min_income/self.obj_function.salary
+            # rounded up, so the repaired position meets min_income on the integer lattice too
+            pos[2] = np.ceil(self.obj_function.min_income/self.obj_function.salary)
         if maxw:= min(2*pos[2], self.obj_function.free_time(pos)) > pos[3]:
             pos[3] = maxw
         return pos
@@ -54,9 +74,15 @@ class BaseGraduaterBee(ABC):
             self.trial += 1
 
     def reset_bee(self, max_trials):
-        '''Resets bee if max trials number is exceeded'''
+        '''
+        Resets bee if max trials number is exceeded
+        Returns:
+            bool: whether the bee was reset
+        '''
         if self.trial >= max_trials:
             self.__reset_bee()
+            return True
+        return False
 
     def force_reset_bee(self):
         '''Resets bee regardless of its state'''
@@ -72,40 +98,65 @@ class BaseGraduaterBee(ABC):
 class EmployeeGraduaterBee(BaseGraduaterBee):
     '''Employee bee model, searches for food in the vicinity of current food source'''
 
-    def explore(self, max_trials):
-        '''Explores surroundings of current position in search of food'''
+    __slots__ = ()
+
+    PHI_BOUNDS = (-2.5, 2.5)
+
+    def explore(self, max_trials, component, phi):
+        '''
+        Explores surroundings of current position in search of food
+        Args:
+            component (int): index of the position component the step is taken from
+            phi (np.array): integer step multipliers, drawn for the whole phase at once
+        '''
         if self.trial <= max_trials:
-            component = np.random.choice(self.pos)
-            phi = [int(elem) for elem in np.random.uniform(low=-2.5, high=2.5, size=len(self.pos))]
-            n_pos = self.pos + (self.pos - component) * phi
+            n_pos = self.pos + (self.pos - self.pos[component]) * phi
             n_pos = self.evaluate_boundaries(n_pos)
+            if not self.obj_function.is_feasible(n_pos):
+                self.trial += 1
+                return
             n_fitness, n_std = self.obj_function.evaluate(n_pos)
             self.update_bee(n_pos, n_fitness, n_std)
 
     def get_fitness(self):
         return self.fitness*10
 
-    def compute_prob(self, max_fitness):
-        self.prob = self.get_fitness() / max_fitness
+    def compute_prob(self, sum_fitness, offset=0.0):
+        '''
+        Args:
+            sum_fitness (float): sum of the shifted fitness of all employees
+            offset (float): shift applied to every fitness, the minimum fitness if it is negative
+        '''
+        self.prob = (self.get_fitness() - offset) / sum_fitness if sum_fitness > 0 else 0.0
 
 
 class OnlookerGradueterBee(BaseGraduaterBee):
     '''Onlooker bee model, looks through the best employees and tries to improve that food source'''
 
-    def onlook(self, best_food_sources, max_trials):
-        '''Look for better source in the vicinity of current best'''
-        candidate = np.random.choice(best_food_sources)
-        self.__exploit(candidate.pos, candidate.fitness, max_trials)
+    __slots__ = ()
+
+    PHI_BOUNDS = (-2.5, -2.5)
 
-    def __exploit(self, candidate, fitness, max_trials):
+    def onlook(self, candidate, max_trials, component, phi):
+        '''
+        Look for better source in the vicinity of a selected employee
+        Args:
+            candidate (EmployeeGraduaterBee): food source drawn by roulette selection
+            component (int): index of the position component the step is taken from
+            phi (np.array): integer step multipliers, drawn for the whole phase at once
+        '''
+        self.__exploit(candidate.pos, candidate.fitness, max_trials, component, phi)
+
+    def __exploit(self, candidate, fitness, max_trials, component, phi):
         if self.trial <= max_trials:
-            component = np.random.choice(candidate)
-            phi = [int(elem) for elem in np.random.uniform(low=-2.5, high=-2.5, size=len(candidate))]
-            n_pos = candidate + (candidate - component) * phi
+            n_pos = candidate + (candidate - candidate[component]) * phi
             n_pos = self.evaluate_boundaries(n_pos)
+            if not self.obj_function.is_feasible(n_pos):
+                self.trial += 1
+                return
             n_fitness, n_std = self.obj_function.evaluate(n_pos)
 
-            if n_fitness >= fitness and sum(n_pos) < self.obj_function.td:
+            if n_fitness >= fitness:
                 self.pos = n_pos
                 self.fitness = n_fitness
                 self.trial = 0
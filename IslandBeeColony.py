@@ -0,0 +1,156 @@
+'''Island model of parallel bee colonies'''
+
+import multiprocessing
+import os
+import numpy as np
+
+from ArtificialBeeColony import EliteSolution, StoppingRules
+from VectorizedBeeColony import VectorizedABC
+
+
+def _island(conn, engine, obj_function, engine_params, seed_sequence):
+    '''
+    Worker process running a single island colony. Serves commands sent by
+    IslandABC through conn:
+        ('run', start, stop): runs iterations [start, stop) and replies with
+            the island's best food source and whether it has stopped
+        ('migrate', pos, fitness, std): offers a migrant food source
+        ('finish',): replies with the optimize result, the tracking curve,
+            stop information and evaluation counters, then exits
+    '''
+    # the island's objective copy samples from the island stream as well
+    rng = np.random.default_rng(seed_sequence)
+    obj_function.rng = rng
+    optimizer = engine(obj_function, rng=rng, **engine_params)
+    optimizer.start()
+    stopped = False
+    while True:
+        command, *args = conn.recv()
+        if command == 'run':
+            start, stop = args
+            for itr in range(start, stop):
+                if stopped:
+                    break
+                stopped = optimizer.step(itr)
+            best = optimizer.optimal_solution
+            conn.send((best.pos, best.fitness, best.std, stopped))
+        elif command == 'migrate':
+            optimizer.migrate(*args)
+        elif command == 'finish':
+            conn.send((optimizer.finish(), optimizer.optimality_tracking,
+                       optimizer.stop_reason, optimizer.stop_iter,
+                       obj_function.evaluations, obj_function.evaluations_skipped))
+            conn.close()
+            return
+
+
+class IslandABC(object):
+    '''
+    Island model: n_islands colonies of colony_size bees each run
+    concurrently in worker processes. Every migration_interval iterations
+    each island sends its best food source to the next island in a ring,
+    where it replaces the worst employee food source if it is better.
+    The global best across islands is reported from optimize.
+
+    Stopping rules apply per island; the run ends when every island has
+    stopped or n_iter is reached. Cache statistics of a CachedObjective
+    stay in the worker processes.
+    '''
+
+    def __init__(self, obj_function, colony_size=30, n_iter=5000, max_trials=100, callbacks=(),
+                 patience=None, tol=0.0, max_time=None, max_evaluations=None, profile=False,
+                 rng=None, n_islands=None, migration_interval=50, engine=VectorizedABC, seed=None):
+        self.obj_function = obj_function
+        self.colony_size = colony_size
+        self.n_iter = n_iter
+        self.n_islands = n_islands or os.cpu_count()
+        self.migration_interval = migration_interval
+        self.engine = engine
+        self.seed = seed
+        self.rng = obj_function.rng if rng is None else np.random.default_rng(rng)
+        self.profile = profile
+        # validated here, the islands build their own rules in the worker processes
+        StoppingRules(patience, tol, max_time, max_evaluations)
+        self.engine_params = dict(colony_size=colony_size, n_iter=n_iter, max_trials=max_trials,
+                                  patience=patience, tol=tol, max_time=max_time,
+                                  max_evaluations=max_evaluations, profile=profile)
+
+        self.optimal_solution = None
+        self.optimality_tracking = np.empty(0)
+        self.stop_reason = None
+        self.stop_iter = None
+        self.island_results = []
+
+        self.callbacks = tuple(callbacks)
+
+    def __notify(self, event, *args):
+        for callback in self.callbacks:
+            getattr(callback, event)(self, *args)
+
+    def __update_optimal_solution(self, bests, iter_):
+        pos, fitness, std, _ = max(bests, key=lambda best: best[1])
+        if self.optimal_solution is None or fitness > self.optimal_solution.fitness:
+            self.optimal_solution = EliteSolution(pos, fitness, std, iter_)
+            self.__notify('on_improvement', iter_, self.optimal_solution)
+
+    def __migrate(self, conns, bests):
+        for i, conn in enumerate(conns):
+            pos, fitness, std, _ = bests[i - 1]
+            conn.send(('migrate', pos, fitness, std))
+
+    def __run_islands(self, conns):
+        for start in range(0, self.n_iter, self.migration_interval):
+            stop = min(start + self.migration_interval, self.n_iter)
+            for conn in conns:
+                conn.send(('run', start, stop))
+            bests = [conn.recv() for conn in conns]
+            self.__update_optimal_solution(bests, stop - 1)
+            self.__notify('on_iteration', stop - 1)
+            if all(stopped for *_, stopped in bests):
+                break
+            if stop < self.n_iter:
+                self.__migrate(conns, bests)
+
+        for conn in conns:
+            conn.send(('finish',))
+        return [conn.recv() for conn in conns]
+
+    def __collect(self, results):
+        self.island_results = results
+        self.stop_iter = max(stop_iter for _, _, _, stop_iter, _, _ in results)
+        self.stop_reason = next(reason for _, _, reason, stop_iter, _, _ in results if stop_iter == self.stop_iter)
+        # an island that stopped early keeps its final fitness
+        self.optimality_tracking = np.max([np.pad(tracking, (0, self.stop_iter - len(tracking)), mode='edge')
+                                           for _, tracking, _, _, _, _ in results], axis=0)
+        self.obj_function.evaluations += sum(evaluations for *_, evaluations, _ in results)
+        self.obj_function.evaluations_skipped += sum(skipped for *_, skipped in results)
+
+    def optimize(self):
+        # drawn from the colony stream unless given, so seeding the objective seeds every island
+        seed = self.seed if self.seed is not None else self.rng.integers(2**32, size=4, dtype=np.uint64)
+        seeds = np.random.SeedSequence(seed).spawn(self.n_islands)
+        pipes = [multiprocessing.Pipe() for _ in range(self.n_islands)]
+        processes = [multiprocessing.Process(target=_island, daemon=True,
+                                             args=(child, self.engine, self.obj_function, self.engine_params, seed))
+                     for (_, child), seed in zip(pipes, seeds)]
+        for process in processes:
+            process.start()
+
+        self.optimal_solution = None
+        self.__notify('on_start')
+        try:
+            results = self.__run_islands([parent for parent, _ in pipes])
+        except BaseException:
+            for process in processes:
+                process.terminate()
+            raise
+        finally:
+            for process in processes:
+                process.join()
+
+        self.__collect(results)
+        self.__notify('on_end')
+        result = self.optimal_solution.fitness, self.optimal_solution.pos, self.optimal_solution.std
+        if self.profile:
+            return result + ({'islands': [island_result[3] for island_result, *_ in results]},)
+        return result
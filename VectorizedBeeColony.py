@@ -0,0 +1,185 @@
+'''Vectorized bee colony'''
+
+import numpy as np
+
+from ArtificialBeeColony import BaseBeeColony, roulette_select
+
+
+class VectorizedABC(BaseBeeColony):
+    '''
+    Artificial bee colony keeping the whole colony in NumPy arrays.
+
+    Follows the employee/onlooker/scout semantics of ArtificialBeeColony.ABC,
+    but every phase is a handful of array operations over the whole colony
+    instead of a loop over bee objects. Rows [0, n_employees) of the
+    position matrix are employee bees, the remaining rows are onlookers.
+    '''
+
+    EMPLOYEE_PHI_BOUNDS = (-2.5, 2.5)
+    ONLOOKER_PHI_BOUNDS = (-2.5, -2.5)
+
+    def __init__(self, obj_function, colony_size=30, n_iter=5000, max_trials=100, callbacks=(),
+                 patience=None, tol=0.0, max_time=None, max_evaluations=None, profile=False, rng=None):
+        super().__init__(obj_function, colony_size, n_iter, max_trials, callbacks,
+                         patience, tol, max_time, max_evaluations, profile, rng)
+        self.n_employees = colony_size // 2
+        self.n_onlookers = colony_size // 2
+
+        self.positions = None
+        self.fitness = None
+        self.std = None
+        self.trials = None
+        self.probs = None
+
+    def _best_food_source(self):
+        best = np.argmax(self.fitness)
+        return self.positions[best], self.fitness[best], self.std[best]
+
+    def __sample(self, n):
+        return self.obj_function.custom_sample_batch(n)
+
+    def __evaluate(self, positions):
+        '''
+        Args:
+            positions (np.array): (n x dim) position matrix
+        Returns:
+            tuple(np.array, np.array): fitness and std vectors
+        '''
+        return self.obj_function.evaluate_batch(positions)
+
+    def __evaluate_feasible(self, positions):
+        '''
+        Evaluates only the rows that pass the objective's constraint checks
+        Returns:
+            tuple(np.array, np.array, np.array): feasibility mask, fitness and std
+                vectors, infeasible rows have -inf fitness
+        '''
+        feasible = self.obj_function.is_feasible(positions)
+        fitness = np.full(len(positions), -np.inf)
+        std = np.full(len(positions), np.nan)
+        fitness[feasible], std[feasible] = self.__evaluate(positions[feasible])
+        return feasible, fitness, std
+
+    def __evaluate_boundaries(self, positions):
+        '''
+        Row-wise equivalent of BaseGraduaterBee.evaluate_boundaries
+        Args:
+            positions (np.array): (n x dim) position matrix, repaired in place
+        '''
+        obj = self.obj_function
+        positions[positions > obj.maxf] = obj.maxf
+        positions[positions < obj.minf] = obj.minf
+        positions[positions[:, 1] > obj.maxl, 1] = obj.maxl
+        positions[positions[:, 2]*obj.salary < obj.min_income, 2] = np.ceil(obj.min_income/obj.salary)
+        free_time = obj.td-(positions[:, 1]+obj.ts_lab)-positions[:, 0]-positions[:, 2:].sum(axis=1)
+        # the per-bee repair stores the boolean outcome of this comparison in pos[3]
+        positions[np.minimum(2*positions[:, 2], free_time) > positions[:, 3], 3] = True
+        return positions
+
+    def __move(self, sources, phi_bounds):
+        '''
+        Moves every row of sources towards a random component of itself
+        Args:
+            sources (np.array): (n x dim) position matrix
+            phi_bounds (tuple): low and high bound of the step multiplier
+        '''
+        n, dim = sources.shape
+        component = sources[np.arange(n), self.rng.integers(dim, size=n)]
+        phi = self.rng.uniform(low=phi_bounds[0], high=phi_bounds[1], size=(n, dim)).astype(int)
+        n_pos = sources + (sources - component[:, np.newaxis]) * phi
+        return self.__evaluate_boundaries(n_pos)
+
+    def __update_bees(self, rows, n_pos, feasible, n_fitness, n_std, reference_fitness):
+        '''
+        Vectorized BaseGraduaterBee.update_bee for the given rows
+        '''
+        improved = feasible & (n_fitness >= reference_fitness)
+        accepted = rows[improved]
+        self.positions[accepted] = n_pos[improved]
+        self.fitness[accepted] = n_fitness[improved]
+        self.std[accepted] = n_std[improved]
+        self.trials[accepted] = 0
+        self.trials[rows[~improved]] += 1
+
+    def __reset_rows(self, rows):
+        if not len(rows):
+            return
+        self.positions[rows] = self.__sample(len(rows))
+        self.fitness[rows], self.std[rows] = self.__evaluate(self.positions[rows])
+        self.trials[rows] = 0
+
+    def _initialize_colony(self, initial_positions):
+        n_bees = self.n_employees + self.n_onlookers
+        if initial_positions is None:
+            self.positions = self.__sample(n_bees)
+        else:
+            initial_positions = np.asarray(initial_positions, dtype=float)
+            initial_positions = initial_positions[self.obj_function.is_feasible(initial_positions)][:n_bees]
+            self.positions = np.vstack((initial_positions, self.__sample(n_bees - len(initial_positions))))
+        self.fitness, self.std = self.__evaluate(self.positions)
+        self.trials = np.zeros(len(self.positions), dtype=int)
+        self.probs = np.zeros(self.n_employees)
+
+    def _colony_state(self):
+        return {'positions': self.positions, 'fitness': self.fitness, 'std': self.std, 'trials': self.trials}
+
+    def _restore_colony(self, state):
+        self.positions = state['positions']
+        self.fitness = state['fitness']
+        self.std = state['std']
+        self.trials = state['trials']
+        self.probs = np.zeros(self.n_employees)
+
+    def _reset_colony(self):
+        self.__reset_rows(np.arange(len(self.positions)))
+
+    def _employee_bees_phase(self):
+        rows = np.flatnonzero(self.trials[:self.n_employees] <= self.max_trials)
+        n_pos = self.__move(self.positions[rows], self.EMPLOYEE_PHI_BOUNDS)
+        feasible, n_fitness, n_std = self.__evaluate_feasible(n_pos)
+        self.__update_bees(rows, n_pos, feasible, n_fitness, n_std, self.fitness[rows])
+
+    def _calculate_probabilities(self):
+        fitness = self.fitness[:self.n_employees]*10
+        # negative fitness is shifted so that the worst food source gets zero probability
+        fitness = fitness - min(fitness.min(), 0.0)
+        sum_fitness = fitness.sum()
+        self.probs = fitness / sum_fitness if sum_fitness > 0 else np.zeros(self.n_employees)
+        self.wheel = np.cumsum(self.probs)
+
+    def _select_best_food_sources(self):
+        '''Draws the food source row of every onlooker at once'''
+        self.best_food_sources = roulette_select(self.wheel, self.n_onlookers, self.rng)
+
+    def _onlooker_bees_phase(self):
+        onlookers = np.arange(self.n_employees, self.n_employees + self.n_onlookers)
+        sources = self.best_food_sources
+        active = self.trials[onlookers] <= self.max_trials
+        rows, sources = onlookers[active], sources[active]
+        n_pos = self.__move(self.positions[sources], self.ONLOOKER_PHI_BOUNDS)
+        feasible, n_fitness, n_std = self.__evaluate_feasible(n_pos)
+        self.__update_bees(rows, n_pos, feasible, n_fitness, n_std, self.fitness[sources])
+
+    def _scout_bees_phase(self):
+        exhausted = np.flatnonzero(self.trials >= self.max_trials)
+        self.__reset_rows(exhausted)
+        self.profiler.count('resets', len(exhausted))
+
+    def migrate(self, pos, fitness, std):
+        '''
+        Replaces the worst employee food source with a migrant food source,
+        if the migrant is better
+        '''
+        worst = np.argmin(self.fitness[:self.n_employees])
+        if fitness > self.fitness[worst]:
+            self.positions[worst] = pos
+            self.fitness[worst] = fitness
+            self.std[worst] = std
+            self.trials[worst] = 0
+
+    def elite_positions(self, n):
+        '''
+        Returns:
+            np.array: (n x dim) positions of the n fittest rows, best first
+        '''
+        return self.positions[np.argsort(-self.fitness, kind='stable')[:n]].copy()
@@ -0,0 +1,121 @@
+'''Streaming statistics of convergence curves'''
+
+import numpy as np
+
+
+class CurveAggregator(object):
+    '''
+    Consumes optimality tracking curves one at a time and keeps, per
+    iteration, Welford mean and variance plus a uniform reservoir of curves
+    for approximate quantiles, so memory does not grow with the number of
+    simulations. Curves stopped early are padded with their final fitness.
+
+    Attributes:
+        n_iter (int): curve length
+        quantiles (tuple): quantile levels reported by quantile_curves
+        reservoir_size (int): number of curves kept for quantile estimates
+        spill (np.memmap): optional (n_curves x n_iter) .npy file receiving every raw curve
+    '''
+
+    def __init__(self, n_iter, quantiles=(0.05, 0.5, 0.95), reservoir_size=256,
+                 spill=None, n_curves=None, seed=None):
+        '''
+        Args:
+            spill (str): path of the .npy file raw curves are written to, requires n_curves
+            n_curves (int): number of curves written to the spill file
+            seed (int): seed of the reservoir sampling stream
+        '''
+        self.n_iter = n_iter
+        self.quantiles = tuple(quantiles)
+        self.reservoir_size = reservoir_size
+        self.rng = np.random.default_rng(seed)
+
+        self.count = 0
+        self.mean = np.zeros(n_iter)
+        self.m2 = np.zeros(n_iter)
+        self.reservoir = np.empty((reservoir_size, n_iter))
+
+        self.spill = None
+        if spill is not None:
+            if n_curves is None:
+                raise ValueError("n_curves is required to spill curves")
+            self.spill = np.lib.format.open_memmap(spill, mode='w+', dtype=np.float64, shape=(n_curves, n_iter))
+
+    def __pad(self, curve):
+        curve = np.asarray(curve, dtype=np.float64)[:self.n_iter]
+        return np.pad(curve, (0, self.n_iter - len(curve)), mode='edge')
+
+    def add(self, curve):
+        '''
+        Args:
+            curve (np.array): optimality tracking of a single run, at most n_iter long
+        '''
+        curve = self.__pad(curve)
+        if self.spill is not None:
+            self.spill[self.count] = curve
+
+        self.count += 1
+        delta = curve - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (curve - self.mean)
+
+        # reservoir sampling keeps every curve seen so far with equal probability
+        if self.count <= self.reservoir_size:
+            self.reservoir[self.count - 1] = curve
+        else:
+            slot = self.rng.integers(self.count)
+            if slot < self.reservoir_size:
+                self.reservoir[slot] = curve
+
+    def merge(self, other):
+        '''
+        Combines the statistics of an aggregator fed with other curves,
+        e.g. by a parallel worker. Raw curves of other are not spilled.
+        '''
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.mean += delta * other.count / count
+
+        # each kept curve stands for count / kept curves of its own stream
+        kept, other_kept = min(self.count, self.reservoir_size), min(other.count, other.reservoir_size)
+        curves = np.concatenate((self.reservoir[:kept], other.reservoir[:other_kept]))
+        weights = np.concatenate((np.full(kept, self.count / kept if kept else 0.0),
+                                  np.full(other_kept, other.count / other_kept)))
+        n_kept = min(count, self.reservoir_size)
+        chosen = self.rng.choice(len(curves), size=n_kept, replace=False, p=weights / weights.sum())
+        self.reservoir[:n_kept] = curves[chosen]
+        self.count = count
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else np.full(self.n_iter, np.nan)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def quantile_curves(self):
+        '''
+        Returns:
+            np.array: (len(quantiles) x n_iter) approximate quantiles per iteration
+        '''
+        return np.quantile(self.reservoir[:min(self.count, self.reservoir_size)], self.quantiles, axis=0)
+
+    def summary(self):
+        '''
+        Returns:
+            dict: JSON serializable statistics of the final iteration
+        '''
+        return {
+            'curves': self.count,
+            'mean': float(self.mean[-1]),
+            'std': float(self.std[-1]),
+            'quantiles': dict(zip(map(str, self.quantiles), self.quantile_curves()[:, -1].tolist())),
+        }
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.flush()
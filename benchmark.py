@@ -0,0 +1,245 @@
+'''Throughput benchmarks for the objective, the optimizers, the sampler and the tuner, plus a checkpoint resume check'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+
+from ArtificialBeeColony import ABC
+from VectorizedBeeColony import VectorizedABC
+from objective import MaximumAverageObjective, term_tables_min_dim
+from simulation import Simulator, build_parser
+from synthetic import synthetic_instance
+
+ENGINES = {"bees": ABC, "vectorized": VectorizedABC}
+TUNE_BENCH_PARAMETERS = [{"coeff1": [1, 2, 3, 4], "coeff2": [1, 2]}]
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_objective(objective_params, n_evals):
+    '''
+    Returns:
+        dict: evaluations per second of evaluate and rows per second of evaluate_batch
+    '''
+    objective = MaximumAverageObjective(**objective_params)
+    X = objective.custom_sample_batch(n_evals)
+
+    start = time.perf_counter()
+    for x in X:
+        objective.evaluate(x)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    objective.evaluate_batch(X)
+    batch = time.perf_counter() - start
+    return {"evaluations": n_evals,
+            "evaluate_per_sec": n_evals / single,
+            "evaluate_batch_rows_per_sec": n_evals / batch}
+
+
+def bench_optimizer(objective_params, *, engines, colony_sizes, dims, n_iter, max_trials):
+    '''
+    Dimensions the term tables do not fit get a synthetic instance
+    Returns:
+        list: iterations per second of every engine, colony size and dimension
+    '''
+    term_tables = dict(MaximumAverageObjective.DEFAULT_TERM_TABLES, **objective_params.get("term_tables", {}))
+    results = []
+    for name in engines:
+        for dim in dims:
+            params = dict(objective_params, dim=dim)
+            if dim < term_tables_min_dim(term_tables):
+                params = synthetic_instance(dim, objective_params, objective_params.get("rng"))
+            for colony_size in colony_sizes:
+                optimizer = ENGINES[name](
+                    MaximumAverageObjective(**params),
+                    colony_size=colony_size, n_iter=n_iter, max_trials=max_trials)
+                start = time.perf_counter()
+                optimizer.optimize()
+                elapsed = time.perf_counter() - start
+                results.append({"engine": name, "dim": dim, "colony_size": colony_size,
+                                "iterations": optimizer.stop_iter,
+                                "iterations_per_sec": optimizer.stop_iter / elapsed})
+    return results
+
+
+def bench_sampler(objective_params, n_samples, batch_size=15):
+    '''
+    Returns:
+        list: custom_sample and custom_sample_batch latency of every sampler,
+            with the rejection acceptance rate
+    '''
+    results = []
+    for sampler in ("rejection", "direct", "auto"):
+        objective = MaximumAverageObjective(**dict(objective_params, sampler=sampler))
+        # the direct sampler builds its table on first use
+        objective.custom_sample()
+        objective.sample_draws = objective.sample_accepts = 0
+        start = time.perf_counter()
+        for _ in range(n_samples):
+            objective.custom_sample()
+        elapsed = time.perf_counter() - start
+
+        n_batches = max(1, n_samples // batch_size)
+        start = time.perf_counter()
+        for _ in range(n_batches):
+            objective.custom_sample_batch(batch_size)
+        batch_elapsed = time.perf_counter() - start
+        results.append({"sampler": sampler, "samples": n_samples,
+                        "latency_sec": elapsed / n_samples,
+                        "batch_size": batch_size,
+                        "batch_latency_sec": batch_elapsed / n_batches,
+                        "acceptance_rate": objective.acceptance_rate if objective.sample_draws else 1.0})
+    return results
+
+
+def bench_scaling(objective_params, dims, n_evals):
+    '''
+    Returns:
+        list: sampling and evaluation throughput of synthetic instances of every dimension
+    '''
+    results = []
+    for dim in dims:
+        objective = MaximumAverageObjective(**synthetic_instance(dim, objective_params, objective_params.get("rng")))
+        start = time.perf_counter()
+        X = objective.custom_sample_batch(n_evals)
+        sample = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for x in X[:max(1, n_evals // 10)]:
+            objective.evaluate(x)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        objective.evaluate_batch(X)
+        batch = time.perf_counter() - start
+        results.append({"dim": dim, "samples_per_sec": n_evals / sample,
+                        "evaluate_per_sec": max(1, n_evals // 10) / single,
+                        "evaluate_batch_rows_per_sec": n_evals / batch})
+    return results
+
+
+def bench_resume(objective_params, *, engines, n_iter, max_trials, seed):
+    '''
+    Checks that a run resumed from a checkpoint written mid-run reproduces
+    the uninterrupted run under the objective's sampler
+    Returns:
+        list: per engine, whether the tracking curves match, the first
+            differing iteration and the checkpoint save time
+    '''
+    objective_params = {key: value for key, value in objective_params.items() if key != "rng"}
+    make = lambda name: ENGINES[name](MaximumAverageObjective(**objective_params, rng=seed),
+                                      n_iter=n_iter, max_trials=max_trials)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in engines:
+            uninterrupted = make(name)
+            uninterrupted.optimize()
+
+            path = os.path.join(tmp, f"{name}.npz")
+            interrupted = make(name)
+            interrupted.start()
+            for itr in range(n_iter // 2):
+                interrupted.step(itr)
+            start = time.perf_counter()
+            interrupted.checkpoint(path, n_iter // 2)
+            elapsed = time.perf_counter() - start
+            resumed = make(name)
+            resumed.optimize(checkpoint=path)
+
+            differences = np.flatnonzero(uninterrupted.optimality_tracking != resumed.optimality_tracking)
+            results.append({"engine": name, "checkpoint_at": n_iter // 2,
+                            "identical": bool(uninterrupted.stop_iter == resumed.stop_iter and not differences.size),
+                            "first_difference": int(differences[0]) if differences.size else None,
+                            "checkpoint_sec": elapsed})
+    return results
+
+
+def bench_tuner(file_parameters, *, cpus, n_iter, vectorized):
+    '''
+    Returns:
+        list: parameter sets per second of a small grid tune for every cpu count
+    '''
+    file_parameters = json.loads(json.dumps(file_parameters))
+    file_parameters["simulation_params"]["n_iter"] = n_iter
+    n_sets = len(list(Simulator._iter(TUNE_BENCH_PARAMETERS)))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        file = os.path.join(tmp, "data.json")
+        with open(file, "w") as df:
+            json.dump(file_parameters, df)
+        for cpu in cpus:
+            argv = ["tune", file, "--cpu", str(cpu)] + (["--vectorized"] if vectorized else [])
+            simulator = Simulator(build_parser().parse_args(argv))
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                simulator.tune(TUNE_BENCH_PARAMETERS)
+            elapsed = time.perf_counter() - start
+            results.append({"cpu": cpu, "parameter_sets": n_sets, "n_iter": n_iter,
+                            "parameter_sets_per_sec": n_sets / elapsed})
+    return results
+
+
+def run_benchmarks(pargs):
+    with open(pargs.file, "r") as df:
+        file_parameters = json.load(df)
+    # every benchmarked objective, and the colonies optimizing it, draw from one seeded stream
+    objective_params = dict(file_parameters["objective_params"], rng=np.random.default_rng(pargs.seed))
+
+    scale = 0.1 if pargs.quick else 1
+    return {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "objective": bench_objective(objective_params, int(20000*scale)),
+        "optimizer": bench_optimizer(objective_params, engines=pargs.engines,
+                                     colony_sizes=pargs.colony_sizes, dims=pargs.dims,
+                                     n_iter=int(500*scale),
+                                     max_trials=file_parameters["simulation_params"]["max_trials"]),
+        "sampler": bench_sampler(objective_params, int(2000*scale)),
+        "resume": bench_resume(objective_params, engines=pargs.engines, n_iter=int(1000*scale),
+                               max_trials=file_parameters["simulation_params"]["max_trials"], seed=pargs.seed),
+        "scaling": bench_scaling(objective_params, pargs.synthetic_dims, int(2000*scale)),
+        "tuner": bench_tuner(file_parameters, cpus=pargs.cpus, n_iter=int(200*scale),
+                             vectorized="vectorized" in pargs.engines),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmarks")
+    parser.add_argument('file', nargs='?', default='data.json', help='Json file with initial params [data.json]')
+    parser.add_argument('--out', '-o', default=None, help="Json file results are written to, stdout if omitted")
+    parser.add_argument('--quick', '-q', action='store_true', help="Run every benchmark at a tenth of its size")
+    parser.add_argument('--seed', '-s', default=0, type=int, help="Seed of the benchmark random stream")
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES),
+                        help="Colony engines benchmarked")
+    parser.add_argument('--colony-sizes', nargs='+', default=[30, 300, 1000], type=int,
+                        help="Colony sizes benchmarked")
+    parser.add_argument('--dims', nargs='+', default=[30, 60], type=int, help="Dimensions benchmarked")
+    parser.add_argument('--synthetic-dims', nargs='+', default=[10, 100, 1000, 10000], type=int,
+                        help="Dimensions of the synthetic instances benchmarked")
+    parser.add_argument('--cpus', nargs='+', default=[1, 2, 4], type=int, help="Tuner cpu counts benchmarked")
+    pargs = parser.parse_args()
+
+    results = run_benchmarks(pargs)
+    if pargs.out:
+        with open(pargs.out, "w") as rf:
+            json.dump(results, rf, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
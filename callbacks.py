@@ -0,0 +1,83 @@
+'''Observers of a colony run'''
+
+import sys
+import time
+
+
+class Callback(object):
+    '''
+    Base observer of ABC.optimize, every hook is a no-op.
+
+    Hooks receive the optimizer, so they can read optimal_solution,
+    optimality_tracking or the objective function counters.
+    '''
+
+    def on_start(self, optimizer):
+        '''Called once the colony is initialized'''
+
+    def on_iteration(self, optimizer, iteration):
+        '''Called at the end of every iteration'''
+
+    def on_improvement(self, optimizer, iteration, solution):
+        '''Called whenever a better optimal solution is recorded'''
+
+    def on_reset(self, optimizer, iteration):
+        '''Called when the whole colony is reset after stagnation'''
+
+    def on_end(self, optimizer):
+        '''Called once the run stops'''
+
+
+class ProgressReporter(Callback):
+    '''
+    Prints the best solution at most every `every` iterations and/or every
+    `seconds` seconds, plus final lines with the best solution, the
+    evaluation counters, the stopping rule and the cache statistics when
+    the run stops.
+
+    Attributes:
+        every (int): iteration interval, None disables it
+        seconds (float): time interval, None disables it
+        show_position (bool): print the position vector as well
+    '''
+
+    def __init__(self, every=None, seconds=None, show_position=False, stream=None):
+        self.every = every
+        self.seconds = seconds
+        self.show_position = show_position
+        self.stream = stream
+        self.last_report = 0.0
+        self.last_iteration = None
+
+    def __report(self, optimizer, iteration):
+        self.last_iteration = iteration
+        stream = self.stream or sys.stdout
+        if self.show_position:
+            print(optimizer.optimal_solution.pos, file=stream)
+        print("iter: {} = cost: {}".format(iteration, optimizer.optimal_solution.fitness), file=stream)
+
+    def on_start(self, optimizer):
+        self.last_report = time.perf_counter()
+        self.last_iteration = None
+
+    def on_iteration(self, optimizer, iteration):
+        due = self.every is not None and (iteration + 1) % self.every == 0
+        if self.seconds is not None and not due:
+            now = time.perf_counter()
+            due = now - self.last_report >= self.seconds
+        if due:
+            self.last_report = time.perf_counter()
+            self.__report(optimizer, iteration)
+
+    def on_end(self, optimizer):
+        if self.every is None and self.seconds is None:
+            return
+        # a run ending on a reporting boundary has its final line already
+        if self.last_iteration != optimizer.stop_iter - 1:
+            self.__report(optimizer, optimizer.stop_iter - 1)
+        stream = self.stream or sys.stdout
+        objective = optimizer.obj_function
+        if hasattr(objective, 'stats'):
+            print(f"CACHE: {objective.stats()}", file=stream)
+        print(f"EVALUATIONS: {objective.evaluations} SKIPPED: {objective.evaluations_skipped}", file=stream)
+        print(f"STOPPED: {optimizer.stop_reason} AFTER {optimizer.stop_iter} ITERATIONS", file=stream)
@@ -0,0 +1,50 @@
+'''Colony checkpoints'''
+
+import hashlib
+import json
+import os
+import numpy as np
+
+
+def config_fingerprint(config):
+    '''
+    Args:
+        config (dict): JSON serializable settings a stored result depends on
+    Returns:
+        str: short hash of the settings, equal for equal settings
+    '''
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def save_checkpoint(path, rngs, **state):
+    '''
+    Writes the state arrays together with the states of the random streams
+    to an .npz file. The file is replaced atomically, so a run preempted
+    while saving keeps its previous checkpoint.
+    Args:
+        rngs (dict): np.random.Generator streams by name
+    '''
+    tmp = f"{path}.tmp.npz"
+    np.savez(tmp, **state, **{f"{name}_state": json.dumps(rng.bit_generator.state)
+                              for name, rng in rngs.items()})
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path, rngs, config=None):
+    '''
+    Restores the random streams saved with the checkpoint
+    Args:
+        rngs (dict): np.random.Generator streams by name, updated in place
+        config (str): fingerprint the checkpoint must have been saved with,
+            a mismatch raises ValueError before any stream is touched
+    Returns:
+        dict: state arrays of the checkpoint
+    '''
+    with np.load(path) as data:
+        state = dict(data)
+    if config is not None and str(state.get('config')) != config:
+        raise ValueError(f"Checkpoint {path} was saved with other settings, "
+                         f"fingerprint {state.get('config')} instead of {config}")
+    for name, rng in rngs.items():
+        rng.bit_generator.state = json.loads(str(state[f"{name}_state"]))
+    return state
@@ -1,6 +1,7 @@
 '''Objective function module'''
 
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 import numpy as np
 
 class ObjectiveFunction(ABC):
@@ -12,9 +13,21 @@ class ObjectiveFunction(ABC):
         dim (float): dimension of objective space
         minf (float): minimum value
         maxf (float): maximum value
+        sampler (str): custom_sample method, 'direct', 'rejection' or 'auto'
+        rng (np.random.Generator): random stream of the samplers
+        sample_draws (int): vectors drawn by the rejection sampler
+        sample_accepts (int): vectors accepted by the rejection sampler
+        evaluations (int): objective evaluations performed
+        evaluations_skipped (int): evaluations avoided by is_feasible
     '''
 
-    def __init__(self, name, dim, minf, maxf, maxl, td, max_iter):
+    SAMPLERS = ('auto', 'direct', 'rejection')
+    MAX_SAMPLER_TABLE_SIZE = 10**7
+    MAX_REJECTION_BLOCK = 4096
+    # overhead of a NumPy call in the sampler cost model, in drawn components
+    SAMPLER_CALL_COST = 1500
+
+    def __init__(self, name, dim, minf, maxf, maxl, td, max_iter, sampler='auto', rng=None):
         self.name = name
         self.dim = dim
         self.minf = minf
@@ -23,89 +36,304 @@ class ObjectiveFunction(ABC):
         self.td = td
         self.max_iter = max_iter
 
-    def __evaluate(self, sample):
-        if sum(sample) < self.td:
-            return True
-        return False
+        if sampler not in self.SAMPLERS:
+            raise ValueError(f"Unknown sampler {sampler}, expected one of {self.SAMPLERS}")
+        self.sampler = sampler
+        self.rng = np.random.default_rng(rng)
+        self.sample_draws = 0
+        self.sample_accepts = 0
+        self.__sampler_table = None
+        self.__lattice_acceptance = None
+
+        self.evaluations = 0
+        self.evaluations_skipped = 0
+
+    def _constraints(self, x):
+        '''
+        Returns:
+            bool or np.array: whether x, or every row of x, fits the time budget
+        '''
+        return np.sum(x, axis=-1) < self.td
+
+    def is_feasible(self, x):
+        '''
+        Cheap constraint check to run before evaluating a candidate.
+        Infeasible candidates are counted in evaluations_skipped.
+        Args:
+            x (np.array): position vector or (n x dim) position matrix
+        Returns:
+            bool or np.array: feasibility of x, or of every row of x
+        '''
+        feasible = self._constraints(x)
+        self.evaluations_skipped += int(np.size(feasible) - np.count_nonzero(feasible))
+        return feasible
+
+    COUNTERS = ('sample_draws', 'sample_accepts', 'evaluations', 'evaluations_skipped')
+
+    def counters(self):
+        '''
+        Returns:
+            dict: sampler and evaluation counters, saved with colony checkpoints
+        '''
+        return {name: getattr(self, name) for name in self.COUNTERS}
+
+    def restore_counters(self, state):
+        '''
+        Continues the counters of a checkpointed run; the rejection sampler
+        sizes its blocks from them, so a resumed run draws the same blocks
+        '''
+        for name in self.COUNTERS:
+            setattr(self, name, int(state[name]))
+
+    def config(self):
+        '''
+        Returns:
+            dict: JSON serializable settings defining the objective values
+        '''
+        return {'name': self.name, 'dim': self.dim, 'minf': self.minf, 'maxf': self.maxf,
+                'maxl': self.maxl, 'td': self.td, 'max_iter': self.max_iter}
+
+    @property
+    def acceptance_rate(self):
+        '''
+        Returns:
+            float: share of vectors accepted by the rejection sampler
+        '''
+        return self.sample_accepts / self.sample_draws if self.sample_draws else 0.0
+
+    def __budget(self):
+        # largest sum of (x - minf) that still satisfies sum(x) < td
+        return min(int(np.ceil(self.td - self.dim*int(self.minf))) - 1,
+                   self.dim*(int(self.maxf) - int(self.minf) - 1))
+
+    def __use_direct_sampler(self, n):
+        if self.sampler != 'auto':
+            return self.sampler == 'direct'
+        if (self.dim + 1)*(self.__budget() + 1) > self.MAX_SAMPLER_TABLE_SIZE:
+            return False
+        direct, rejection = self.__sampler_costs(n)
+        return direct < rejection
+
+    def __sampler_costs(self, n):
+        '''
+        Expected cost of n samples in drawn components, a NumPy call counted
+        as SAMPLER_CALL_COST: the direct sampler takes one step per component
+        weighing every value, the rejection sampler draws n / acceptance
+        vectors in blocks
+        Returns:
+            tuple(float, float): cost of the direct and of the rejection sampler
+        '''
+        if self.__sampler_table is None:
+            self.__sampler_table = self.__build_sampler_table()
+        width = int(self.maxf) - int(self.minf)
+        direct = self.dim*(self.SAMPLER_CALL_COST + n*width)
+        if not self.__lattice_acceptance > 0:
+            return direct, np.inf
+        draws = n / self.__lattice_acceptance
+        rejection = np.ceil(draws / self.MAX_REJECTION_BLOCK)*self.SAMPLER_CALL_COST + draws*self.dim
+        return direct, rejection
+
+    def __build_sampler_table(self):
+        '''
+        Row k holds, up to a per-row scale, the number of ways k lattice
+        components in [0, maxf-minf) can sum to at most r, for every r
+        within the budget. The scales give the share of lattice vectors
+        within the budget, the acceptance rate of the rejection sampler.
+        '''
+        budget = self.__budget()
+        if budget < 0:
+            raise ValueError(f"No position within [{self.minf}, {self.maxf}) sums below td={self.td}")
+        width = int(self.maxf) - int(self.minf)
+        table = np.empty((self.dim + 1, budget + 1))
+        table[0] = 1.0
+        log_scale = 0.0
+        for k in range(1, self.dim + 1):
+            row = np.convolve(table[k - 1], np.ones(width))[:budget + 1]
+            table[k] = row / row.max()
+            log_scale += np.log(row.max())
+        self.__lattice_acceptance = table[self.dim, budget]*np.exp(log_scale - self.dim*np.log(width))
+        return table
 
     def sample(self):
         '''
         Returns:
             np.array: sample values.
         '''
-        return np.random.uniform(low=self.minf, high=self.maxf, size=self.dim)
+        return self.rng.uniform(low=self.minf, high=self.maxf, size=self.dim)
+
+    def __direct_sample(self, n):
+        '''
+        Draws n integer vectors uniformly from {minf, ..., maxf-1}^dim
+        restricted to sum < td, which is the distribution the rejection
+        sampler converges to. Components are drawn one at a time, weighted
+        by the number of completions of the remaining components that
+        stay within the budget.
+        '''
+        if self.__sampler_table is None:
+            self.__sampler_table = self.__build_sampler_table()
+        table = self.__sampler_table
+        values = np.arange(int(self.maxf) - int(self.minf))
+        remaining = np.full(n, table.shape[1] - 1)
+        samples = np.empty((n, self.dim), dtype=int)
+        for i in range(self.dim):
+            left = remaining[:, np.newaxis] - values
+            weights = np.where(left >= 0, table[self.dim - i - 1][np.maximum(left, 0)], 0)
+            cdf = np.cumsum(weights, axis=1)
+            u = self.rng.uniform(low=0, high=1, size=n) * cdf[:, -1]
+            samples[:, i] = np.minimum((cdf <= u[:, np.newaxis]).sum(axis=1), np.minimum(remaining, len(values) - 1))
+            remaining -= samples[:, i]
+        return samples + int(self.minf)
+
+    def __rejection_sample(self, n):
+        '''
+        Draws candidate vectors in blocks sized by the acceptance rate seen
+        so far and keeps the ones with sum < td, in order
+        '''
+        accepted = []
+        missing = n
+        while missing > 0:
+            rate = self.acceptance_rate if self.sample_accepts else 1.0
+            block = min(max(int(np.ceil(missing / rate)), missing), self.MAX_REJECTION_BLOCK)
+            samples = (self.minf + self.rng.uniform(low=0, high=1, size=(block, self.dim))
+                       * (self.maxf - self.minf)).astype(int)
+            samples = samples[np.sum(samples, axis=1) < self.td]
+            self.sample_draws += block
+            self.sample_accepts += len(samples)
+            samples = samples[:missing]
+            accepted.append(samples)
+            missing -= len(samples)
+        return np.concatenate(accepted) if accepted else np.empty((0, self.dim), dtype=int)
 
     def custom_sample(self):
         '''
         Returns:
             np.array: sample values calculated using custom method.
         '''
-        while True:
-            sample = np.repeat(self.minf, repeats=self.dim) \
-                + np.random.uniform(low=0, high=1, size=self.dim) *\
-                np.repeat(self.maxf-self.minf, repeats=self.dim)
-            sample = np.array([int(elem) for elem in sample])
-            if self.__evaluate(sample):
-                return sample
+        if self.__use_direct_sampler(1):
+            return self.__direct_sample(1)[0]
+        return self.__rejection_sample(1)[0]
+
+    def custom_sample_batch(self, n):
+        '''
+        Returns:
+            np.array: (n x dim) matrix of custom samples, one per row
+        '''
+        if self.__use_direct_sampler(n):
+            return self.__direct_sample(n)
+        return self.__rejection_sample(n)
 
     @abstractmethod
     def evaluate(self, x):
         '''not implemented'''
 
 
+def term_tables_min_dim(term_tables):
+    '''
+    Returns:
+        int: smallest dimension every index of the term tables fits
+    '''
+    return max((int(index) + 1 if int(index) >= 0 else -int(index)
+                for table in term_tables.values() for index in table), default=0)
+
+
+def compile_terms(table, dim):
+    '''
+    Compiles a sparse term table for a gathered dot product
+    Args:
+        table (iterable): (index, coefficient) pairs, negative indices count
+            from the end as in x[..., i], repeated indices add up
+        dim (int): dimension of the positions the table applies to
+    Returns:
+        tuple(np.array, np.array): position indices and their coefficients
+    '''
+    indices, coefficients = [], []
+    for index, coefficient in table:
+        index = int(index)
+        if not -dim <= index < dim:
+            raise ValueError(f"Term index {index} out of range for dimension {dim}")
+        indices.append(index % dim)
+        coefficients.append(coefficient)
+    return np.array(indices, dtype=np.intp), np.array(coefficients, dtype=float)
+
+
 class TermGraduaterObjectiveFunction(ObjectiveFunction):
     '''
     Term Graduater Objective
     Inherits from objective function
+
+    Linear parts of the terms are sparse {index: coefficient} tables,
+    compiled once into index and coefficient arrays:
+        salary: weekly expenses and incomes, on top of x[2]*salary and x[3]*party_cost
+        satisfaction: free time activities added to the free time
+        attendance: lecture attendance subtracted from maxl in the missed lecture penalty
+        penalty: weights of the missed lecture penalty in the grade average
     '''
 
-    def __init__(self, dim, *, minf, maxf, maxl, ts_lab, td, salary, party_cost, max_iter):
+    DEFAULT_TERM_TABLES = {
+        'salary': {4: 5, 7: 1, 13: -23, 15: 3, 18: -33, 22: 12, 25: -75, -1: 66},
+        'satisfaction': {3: 3, 7: 12, 10: 5, 16: 8, 20: 4, 24: 9, 17: -87, 27: 7},
+        'attendance': {1: 1, 7: 9, 3: 4},
+        'penalty': {20: 1},
+    }
+
+    def __init__(self, dim=30, *, minf, maxf, maxl, ts_lab, td, salary, party_cost, max_iter, sampler='auto', rng=None,
+                 term_tables=None):
         super().__init__(
             'TermGraduaterObjectiveFunction',
-            dim, minf, maxf, maxl, td, max_iter)
+            dim, minf, maxf, maxl, td, max_iter, sampler, rng)
 
         self.td = td
         self.ts_lab = ts_lab
         self.salary = salary
         self.party_cost = party_cost
 
+        unknown = set(term_tables or ()) - set(self.DEFAULT_TERM_TABLES)
+        if unknown:
+            raise ValueError(f"Unknown term tables {sorted(unknown)}, expected {sorted(self.DEFAULT_TERM_TABLES)}")
+        self.term_tables = dict(self.DEFAULT_TERM_TABLES, **(term_tables or {}))
+        self._compiled_terms = {}
+        for name, table in self.term_tables.items():
+            try:
+                self._compiled_terms[name] = compile_terms(table.items(), dim)
+            except ValueError as err:
+                raise ValueError(f"Term table {name} does not fit dimension {dim} ({err}), pass term_tables "
+                                 f"for this dimension, e.g. generated by synthetic.py") from err
+        self._compiled_terms['salary'] = compile_terms(
+            [(2, salary), (3, party_cost), *self.term_tables['salary'].items()], dim)
+
+    def _sparse_dot(self, x, name):
+        '''
+        Returns:
+            float or np.array: dot product of x, or of every row of x, with a compiled term table
+        '''
+        indices, coefficients = self._compiled_terms[name]
+        return x[..., indices] @ coefficients
+
+    def config(self):
+        return dict(super().config(), ts_lab=self.ts_lab, salary=self.salary, party_cost=self.party_cost,
+                    term_tables={name: (indices.tolist(), coefficients.tolist())
+                                 for name, (indices, coefficients) in self._compiled_terms.items()})
+
     def free_time(self, x: np.array):
         '''
         Returns:
             float: remaining free time
         '''
-        return self.td-(x[1]+self.ts_lab)-x[0]-sum(x[2:])
+        return self.td-(x[..., 1]+self.ts_lab)-x[..., 0]-np.sum(x[..., 2:], axis=-1)
 
     def _salary(self, x: np.array):
         '''
         Returns:
             float: Funds left after a week
         '''
-        return x[2]*self.salary +\
-               x[3]*self.party_cost +\
-               x[4]*5 +\
-               x[7]*1 +\
-               x[13]*-23 +\
-               x[15]*3 +\
-               x[18]*-33 +\
-               x[22]*12 +\
-               x[25]*-75 +\
-               x[-1]*66
+        return self._sparse_dot(x, 'salary')
 
     def _satisfaction_coeff(self, x: np.array, alpha=0.008):
         '''
         Returns:
             float: satisfaction coefficient
         '''
-        return (self.free_time(x) +\
-                3*x[3] +\
-                12*x[7] +\
-                5*x[10] +\
-                8*x[16]+\
-                4*x[20] +\
-                9*x[24] -\
-                87*x[17] +\
-                7*x[27])*alpha
+        return (self.free_time(x) + self._sparse_dot(x, 'satisfaction'))*alpha
 
     def _study_reward(self, x: np.array, alpha=0.1429):
         '''
@@ -123,14 +351,14 @@ class TermGraduaterObjectiveFunction(ObjectiveFunction):
         Returns:
             float: accumulated penalty for missed lectures
         '''
-        return alpha*(1.5**(self.maxl-x[1]-x[7]*9-x[3]*4))
+        return alpha*(1.5**(self.maxl-self._sparse_dot(x, 'attendance')))
 
     def _avg(self, x: np.array):
         """
         Returns:
             float: grade average. MINF < average < MAXF
         """
-        return self.minf+3+self._missed_lec_penalty(x)*x[20]+self._study_reward(x)*x[0]
+        return self.minf+3+self._missed_lec_penalty(x)*self._sparse_dot(x, 'penalty')+self._study_reward(x)*x[..., 0]
 
     def _max_salary(self, x: np.array):
         """
@@ -143,17 +371,30 @@ class TermGraduaterObjectiveFunction(ObjectiveFunction):
     def evaluate(self, x):
         '''Not implemented'''
 
+    @abstractmethod
+    def evaluate_batch(self, X):
+        '''Not implemented'''
+
 
 class MaximumAverageObjective(TermGraduaterObjectiveFunction):
-    '''Maximum average objective function'''
+    '''
+    Maximum average objective function
 
-    def __init__(self, dim, *, minf=0, maxf=60, maxl=9, ts_lab=11.5,
+    Adds the activity term table, the components weighted by coeff2
+    '''
+
+    TERM_COEFFICIENTS = ('avg_coeff', 'free_time_coeff', 'salary_coeff', 'coeff1', 'coeff2', 'coeff3')
+    DEFAULT_TERM_TABLES = dict(TermGraduaterObjectiveFunction.DEFAULT_TERM_TABLES,
+                               activity={index: 1 for index in range(2, 16)})
+
+    def __init__(self, dim=30, *, minf=0, maxf=60, maxl=9, ts_lab=11.5,
                  td=96, salary=25, party_cost=-12.5, min_income=500,
                  avg_coeff=1, salary_coeff=1, free_time_coeff=1, 
-                 coeff1=1, coeff2=1, coeff3=1, max_iter=50):
+                 coeff1=1, coeff2=1, coeff3=1, max_iter=50, sampler='auto', rng=None, term_tables=None):
         super().__init__(dim, minf=minf, maxf=maxf, maxl=maxl,
                          ts_lab=ts_lab, td=td, salary=salary,
-                         party_cost=party_cost, max_iter=max_iter)
+                         party_cost=party_cost, max_iter=max_iter, sampler=sampler, rng=rng,
+                         term_tables=term_tables)
         self.name = 'MaximumAverageObjective'
         self.avg_coeff = avg_coeff
         self.salary_coeff = salary_coeff
@@ -163,6 +404,48 @@ class MaximumAverageObjective(TermGraduaterObjectiveFunction):
         self.coeff3 = coeff3
         self.min_income = min_income
 
+    @property
+    def coefficients(self):
+        '''
+        Returns:
+            tuple: term coefficients in TERM_COEFFICIENTS order
+        '''
+        return tuple(getattr(self, name) for name in self.TERM_COEFFICIENTS)
+
+    def config(self):
+        return dict(super().config(), min_income=self.min_income,
+                    **dict(zip(self.TERM_COEFFICIENTS, self.coefficients)))
+
+    def _constraints(self, x):
+        return super()._constraints(x) & (x[..., 2]*self.salary >= self.min_income)
+
+    def _raw_terms(self, x):
+        return (self._avg(x),
+                self.free_time(x),
+                self._salary(x),
+                np.sum(x[..., ::3], axis=-1),
+                self._sparse_dot(x, 'activity'),
+                np.sum(x[..., ::2], axis=-1))
+
+    def _weighted_terms(self, x):
+        '''
+        Args:
+            x (np.array): position vector or (n x dim) position matrix
+        Returns:
+            tuple: coefficient weighted objective terms, each computed once
+        '''
+        return tuple(coeff*term for coeff, term in zip(self.coefficients, self._raw_terms(x)))
+
+    def terms(self, x):
+        '''
+        Args:
+            x (np.array): position vector or (n x dim) position matrix
+        Returns:
+            np.array: unweighted objective terms along the last axis,
+                in TERM_COEFFICIENTS order
+        '''
+        return np.stack(np.broadcast_arrays(*self._raw_terms(x)), axis=-1).astype(float)
+
     def evaluate(self, x) -> float:
         '''
         Args:
@@ -174,8 +457,133 @@ class MaximumAverageObjective(TermGraduaterObjectiveFunction):
         Returns:
             Objective function value
         '''
+        self.evaluations += 1
+        terms = self._weighted_terms(x)
+        return sum(terms), np.std(np.array(terms))
 
-        return self.avg_coeff*self._avg(x)+self.free_time_coeff*self.free_time(x)+self.salary_coeff*(self._salary(x))+\
-               self.coeff1*(sum(x[::3]))+self.coeff2*(sum(x[2:16]))+self.coeff3*(sum(x[::2])),\
-               np.std(np.array([self.avg_coeff*self._avg(x), self.free_time_coeff*self.free_time(x), self.salary_coeff*(self._salary(x)),\
-                      self.coeff1*(sum(x[::3])), self.coeff2*(sum(x[2:16])), self.coeff3*(sum(x[::2]))]))
+    def evaluate_batch(self, X):
+        '''
+        Args:
+            X (np.array): (n x dim) position matrix, one position per row
+        Returns:
+            tuple(np.array, np.array): objective function values and term std per row
+        '''
+        self.evaluations += len(X)
+        terms = self._weighted_terms(X)
+        return sum(terms), np.std(np.stack(terms, axis=-1), axis=-1)
+
+
+
+class CachedObjective(object):
+    '''
+    Bounded LRU cache of (fitness, std) in front of an objective function.
+    Positions are keyed on their raw bytes as float64, so equal integer and
+    float positions share an entry. Every other attribute is delegated to
+    the wrapped objective.
+
+    Attributes:
+        objective (ObjectiveFunction): wrapped objective
+        maxsize (int): maximum number of cached positions
+        hits (int), misses (int), evictions (int): cache counters
+    '''
+
+    def __init__(self, objective, maxsize=4096):
+        self.objective = objective
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getattr__(self, name):
+        if name == 'objective':
+            raise AttributeError(name)
+        return getattr(self.objective, name)
+
+    @property
+    def rng(self):
+        return self.objective.rng
+
+    @rng.setter
+    def rng(self, rng):
+        self.objective.rng = rng
+
+    def __deepcopy__(self, memo):
+        # copies of bees share the objective, and therefore its cache
+        return self
+
+    @staticmethod
+    def __key(x):
+        return np.ascontiguousarray(x, dtype=np.float64).tobytes()
+
+    def __lookup(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.cache.move_to_end(key)
+        return value
+
+    def __store(self, key, value):
+        self.cache[key] = value
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def evaluate(self, x):
+        key = self.__key(x)
+        value = self.__lookup(key)
+        if value is None:
+            value = self.objective.evaluate(x)
+            self.__store(key, value)
+        return value
+
+    def evaluate_batch(self, X):
+        '''
+        Evaluates only the rows of X that are not cached, in a single batch
+        '''
+        fitness = np.empty(len(X))
+        std = np.empty(len(X))
+        keys = [self.__key(row) for row in X]
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.__lookup(key)
+            if value is None:
+                missing.append(i)
+            else:
+                fitness[i], std[i] = value
+        if missing:
+            fitness[missing], std[missing] = self.objective.evaluate_batch(X[missing])
+            for i in missing:
+                self.__store(keys[i], (fitness[i], std[i]))
+        return fitness, std
+
+    def stats(self):
+        '''
+        Returns:
+            dict: cache counters and hit rate
+        '''
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self.cache), "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+def sweep_scores(terms, coefficients):
+    '''
+    Scores term vectors against many coefficient combinations at once.
+    Fitness is a single matrix product, std is derived from the first and
+    second moments of the weighted terms.
+    Args:
+        terms (np.array): (n x k) unweighted terms, see MaximumAverageObjective.terms
+        coefficients (np.array): (m x k) coefficient combinations, same term order
+    Returns:
+        tuple(np.array, np.array): (n x m) objective function values and term std
+    '''
+    terms = np.atleast_2d(terms)
+    coefficients = np.atleast_2d(coefficients)
+    n_terms = terms.shape[-1]
+    fitness = terms @ coefficients.T
+    second_moment = (terms**2) @ (coefficients**2).T / n_terms
+    std = np.sqrt(np.maximum(second_moment - (fitness / n_terms)**2, 0))
+    return fitness, std
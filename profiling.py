@@ -0,0 +1,89 @@
+'''Optimizer instrumentation'''
+
+from contextlib import nullcontext
+import time
+
+
+class PhaseTimer(object):
+    '''Context manager accumulating wall time of one phase'''
+
+    __slots__ = ('elapsed', 'calls', 'start')
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.calls = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed += time.perf_counter() - self.start
+        self.calls += 1
+        return False
+
+
+class PhaseProfiler(object):
+    '''
+    Records wall time per optimizer phase and event counters.
+    Objective evaluations and feasibility rejections are read from the
+    objective's own counters at the start and end of a run.
+    '''
+
+    PHASES = ('employee', 'probabilities', 'selection', 'onlooker', 'scout', 'optimal_update')
+
+    def __init__(self):
+        self.timers = {name: PhaseTimer() for name in self.PHASES}
+        self.counters = {}
+        self.start_time = 0.0
+        self.start_evaluations = 0
+        self.start_skipped = 0
+
+    def start(self, obj_function):
+        self.timers = {name: PhaseTimer() for name in self.PHASES}
+        self.counters = {'resets': 0, 'colony_resets': 0}
+        self.start_time = time.perf_counter()
+        self.start_evaluations = obj_function.evaluations
+        self.start_skipped = obj_function.evaluations_skipped
+
+    def phase(self, name):
+        return self.timers[name]
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self, obj_function, iterations):
+        '''
+        Returns:
+            dict: JSON serializable profile of the run
+        '''
+        return {
+            'total_time': time.perf_counter() - self.start_time,
+            'iterations': iterations,
+            'phases': {name: {'time': timer.elapsed, 'calls': timer.calls}
+                       for name, timer in self.timers.items()},
+            'evaluations': obj_function.evaluations - self.start_evaluations,
+            'feasibility_rejections': obj_function.evaluations_skipped - self.start_skipped,
+            **self.counters,
+        }
+
+
+class NullProfiler(object):
+    '''Profiler used when instrumentation is off, every call is a no-op'''
+
+    __slots__ = ()
+
+    NULL_PHASE = nullcontext()
+
+    def start(self, obj_function):
+        pass
+
+    def phase(self, name):
+        return self.NULL_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+    def report(self, obj_function, iterations):
+        return None
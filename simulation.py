@@ -1,26 +1,31 @@
 import argparse
+import hashlib
 import json
 import numpy as np
-import matplotlib.pyplot as plt
 import multiprocessing
 import os
 import pprint
 
+from contextlib import nullcontext
+from functools import partial
 from itertools import product
+from queue import Empty
 
 from ArtificialBeeColony import ABC
-from objective import MaximumAverageObjective
+from aggregation import CurveAggregator
+from callbacks import ProgressReporter
+from checkpoint import config_fingerprint
+from IslandBeeColony import IslandABC
+from VectorizedBeeColony import VectorizedABC
+from objective import CachedObjective, MaximumAverageObjective, sweep_scores
 
 class Simulator:
 
-    min_std = np.inf
-    max_params = None
-    max_x = None
+    STOPPING_PARAMS = ('patience', 'tol', 'max_time', 'max_evaluations')
 
     def __init__(self, parser_args):
         self.parser_args = parser_args
         self.file_parameters = None
-        self.return_dict = None
 
     def _read_data(self):
         try:
@@ -32,31 +37,123 @@ class Simulator:
             print(err)
 
     @staticmethod
-    def _simulate(obj_function, obj_function_params, *, colony_size=30, n_iter=5000, max_trials=100, simulations=30):
-        values = np.zeros(n_iter)
+    def _epoch(obj_function, obj_function_params, seed_sequence, *, colony_size, n_iter, max_trials,
+               engine, cache_size, stopping, profile, callbacks, checkpoint_dir=None, checkpoint_every=None):
+        # every epoch draws from its own stream, results do not depend on the worker running it
+        objective = obj_function(**obj_function_params, rng=np.random.default_rng(seed_sequence))
+        if cache_size:
+            objective = CachedObjective(objective, maxsize=cache_size)
+        optimizer = engine(
+            objective,
+            colony_size=colony_size,
+            n_iter=n_iter,
+            max_trials=max_trials,
+            callbacks=callbacks,
+            profile=profile,
+            **stopping
+            )
+        checkpoint = {}
+        if checkpoint_dir is not None:
+            # named by the config and the master seed, rerunning the same config with the same --seed resumes every epoch
+            checkpoint = dict(checkpoint=os.path.join(
+                checkpoint_dir,
+                f"epoch_{optimizer.fingerprint()}_{seed_sequence.entropy}_{seed_sequence.spawn_key[-1]}.npz"),
+                checkpoint_every=checkpoint_every)
+        fitness, _, _, *report = optimizer.optimize(**checkpoint)
+        return fitness, optimizer.optimality_tracking, report[0] if report else None
+
+    @staticmethod
+    def _simulate(obj_function, obj_function_params, *, colony_size=30, n_iter=5000, max_trials=100, simulations=30,
+                  engine=ABC, cache_size=0, processes=1, seed=None,
+                  patience=None, tol=0.0, max_time=None, max_evaluations=None, profile=None,
+                  progress=None, progress_seconds=None, spill_curves=None,
+                  checkpoint_dir=None, checkpoint_every=None):
+        seed_sequence = np.random.SeedSequence(seed)
+        print(f"SEED: {seed_sequence.entropy}")
+        stopping = dict(patience=patience, tol=tol, max_time=max_time, max_evaluations=max_evaluations)
+        epoch = partial(Simulator._epoch, obj_function, obj_function_params,
+                        colony_size=colony_size, n_iter=n_iter, max_trials=max_trials,
+                        engine=engine, cache_size=cache_size, stopping=stopping,
+                        profile=profile is not None,
+                        callbacks=Simulator._reporters(progress, progress_seconds),
+                        checkpoint_dir=checkpoint_dir, checkpoint_every=checkpoint_every)
+        if checkpoint_dir is not None:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+        curves = CurveAggregator(n_iter, spill=spill_curves, n_curves=simulations, seed=seed)
         fitnesses = []
-        for _ in range(simulations):
-            optimizer = ABC(
-                obj_function(30, **obj_function_params),
-                colony_size=colony_size,
-                n_iter=n_iter,
-                max_trials=max_trials
-                )
-            fitness, _, _ = optimizer.optimize()
-            fitnesses.append(fitness)
-            values += np.array(optimizer.optimality_tracking)
-        values /= simulations
-        std = np.std(fitnesses)
+        reports = []
+        streams = seed_sequence.spawn(simulations)
+        with multiprocessing.Pool(processes=processes) if processes > 1 else nullcontext() as pool:
+            for fitness, optimality_tracking, report in (pool.imap(epoch, streams) if pool else map(epoch, streams)):
+                fitnesses.append(fitness)
+                reports.append(report)
+                curves.add(optimality_tracking)
+        curves.close()
+        print(f"FINAL ITERATION: {curves.summary()}")
+        if spill_curves is not None:
+            print(f"CURVES WRITTEN TO {spill_curves}")
+
+        if profile is not None:
+            with open(profile, "w") as pf:
+                json.dump(reports, pf, indent=2)
+            print(f"PROFILE WRITTEN TO {profile}")
 
+        return fitnesses, curves
+
+    @staticmethod
+    def _plot(fitnesses, curves, *, colony_size, n_iter, max_trials, plot_out=None):
+        '''
+        Plots the fitness of every simulation and the mean convergence curve
+        within the band of the outermost aggregated quantiles.
+        matplotlib is imported only here, with a non-interactive backend when
+        the figures are written to plot_out instead of being shown.
+        Args:
+            plot_out (str): convergence curve file, its extension selects the format;
+                the fitness scatter is written next to it with a _simulations suffix
+        '''
+        import matplotlib
+        if plot_out is not None:
+            matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        simulations = len(fitnesses)
         if simulations > 1:
             plt.figure(1, figsize=(10, 7))
             plt.scatter(np.linspace(0, simulations-1, num=simulations, dtype=int), fitnesses, lw=0.5)
-            plt.title(f"Fitness across {simulations} simulations with standard deviation $\sigma$={std}")
+            plt.title(f"Fitness across {simulations} simulations with standard deviation $\\sigma$={np.std(fitnesses)}")
+            if plot_out is not None:
+                root, ext = os.path.splitext(plot_out)
+                plt.savefig(f"{root}_simulations{ext}")
         plt.figure(2, figsize=(10, 7))
-        plt.plot(np.linspace(0, n_iter-1, num=n_iter, dtype=int), values, lw=0.5, color='b')
+        iterations = np.linspace(0, n_iter-1, num=n_iter, dtype=int)
+        if len(fitnesses) > 1:
+            quantiles = curves.quantile_curves()
+            plt.fill_between(iterations, quantiles[0], quantiles[-1], color='b', alpha=0.2, lw=0,
+                             label=f"quantiles {curves.quantiles[0]}-{curves.quantiles[-1]}")
+        plt.plot(iterations, curves.mean, lw=0.5, color='b', label="mean")
         plt.xlabel("Iteration")
         plt.ylabel("Fitness")
         plt.title(f"Colony size: {colony_size}, Number of iterations {n_iter}, maximum trials: {max_trials}")
+        plt.legend()
+        if plot_out is not None:
+            plt.savefig(plot_out)
+            print(f"PLOT WRITTEN TO {plot_out}")
+        else:
+            plt.show()
+
+    @staticmethod
+    def _reporters(every, seconds):
+        if every is None and seconds is None:
+            return ()
+        return (ProgressReporter(every=every, seconds=seconds),)
+
+    def _engine(self):
+        engine = VectorizedABC if self.parser_args.vectorized else ABC
+        if getattr(self.parser_args, 'islands', None):
+            return partial(IslandABC, engine=engine, n_islands=self.parser_args.islands,
+                           migration_interval=self.parser_args.migration_interval)
+        return engine
 
     @staticmethod
     def _iter(tune_parameters):
@@ -64,81 +161,465 @@ class Simulator:
             items = sorted(p.items())
             keys, values = zip(*items)
             for v in product(*values):
-                params = dict(zip(keys, v))
+                params = dict(zip(keys, (value.item() if isinstance(value, np.generic) else value for value in v)))
                 yield params
 
-    def _tune_process(self, parameters_set):
-        objective_parameters = self.file_parameters["objective_params"]
-        objective_parameters.update(parameters_set)
-        # print("RUNNING TUNING WITH PARAMETERS:"
-        #     f"{objective_parameters}")
-        optimizer = ABC(
-            MaximumAverageObjective(30, **objective_parameters),
-            colony_size=self.file_parameters['simulation_params']['colony_size'],
-            n_iter=self.file_parameters['simulation_params']['n_iter'],
-            max_trials=self.file_parameters['simulation_params']['max_trials'],
-            suppress_output=True)
-        _, x, std = optimizer.optimize()
-        print(f"OUTPUT STD: {std}")
-        if std < self.min_std:
-            self.max_params = parameters_set
-            self.min_std = std
-            self.max_x = x
-
-            self.return_dict["max_params"] = self.max_params
-            self.return_dict["min_std"] = self.min_std
-            self.return_dict["max_x"] = self.max_x
+    def _objective(self, objective_parameters):
+        objective = MaximumAverageObjective(**objective_parameters)
+        if self.parser_args.cache_size:
+            objective = CachedObjective(objective, maxsize=self.parser_args.cache_size)
+        return objective
+
+    def _optimizer(self, objective_parameters, n_iter=None):
+        simulation_params = self.file_parameters['simulation_params']
+        return self._engine()(
+            self._objective(objective_parameters),
+            colony_size=simulation_params['colony_size'],
+            n_iter=n_iter if n_iter is not None else simulation_params['n_iter'],
+            max_trials=simulation_params['max_trials'],
+            callbacks=self._reporters(self.parser_args.progress, self.parser_args.progress_seconds),
+            **{key: simulation_params[key] for key in self.STOPPING_PARAMS if key in simulation_params})
+
+    def _tune_process(self, task, initial_positions=None):
+        record, _ = self._tune_run(task, initial_positions)
+        return record
+
+    def _tune_chain(self, tasks, queue):
+        '''
+        Runs consecutive grid points in one worker, every optimization starts
+        from the elite positions of the previous one. The record of every
+        task is put on queue as soon as it finishes.
+        '''
+        elite = None
+        for task in tasks:
+            record, optimizer = self._tune_run(task, elite)
+            elite = optimizer.elite_positions(optimizer.colony_size // 2)
+            queue.put(record)
+
+    def _stream_chains(self, pool, chains):
+        '''
+        Runs the chains on the pool and yields the records of their tasks
+        in the order they finish
+        '''
+        with multiprocessing.Manager() as manager:
+            queue = manager.Queue()
+            result = pool.map_async(partial(self._tune_chain, queue=queue), chains)
+            remaining = sum(map(len, chains))
+            while remaining:
+                try:
+                    record = queue.get(timeout=1)
+                except Empty:
+                    if result.ready():
+                        # re-raises the error of a failed chain
+                        result.get()
+                    continue
+                remaining -= 1
+                yield record
+            result.get()
+
+    def _tune_run(self, task, initial_positions=None):
+        parameters_set, n_iter = task
+        objective_parameters = dict(self.file_parameters["objective_params"], **parameters_set)
+        optimizer = self._optimizer(objective_parameters, n_iter=n_iter)
+        fitness, x, std = optimizer.optimize(initial_positions)
+        return {"params": parameters_set, "n_iter": n_iter, "fingerprint": self._fingerprint(), "std": float(std),
+                "fitness": float(fitness), "x": np.asarray(x).tolist(),
+                "evaluations": optimizer.obj_function.evaluations,
+                "evaluations_skipped": optimizer.obj_function.evaluations_skipped,
+                "stop_reason": optimizer.stop_reason, "stop_iter": optimizer.stop_iter}, optimizer
+
+    def _fingerprint(self):
+        '''
+        Returns:
+            str: hash of the file objective parameters, the colony settings and
+                the engine a tuning record was produced with
+        '''
+        simulation_params = self.file_parameters['simulation_params']
+        return config_fingerprint({
+            "objective_params": self.file_parameters['objective_params'],
+            "colony_size": simulation_params['colony_size'],
+            "max_trials": simulation_params['max_trials'],
+            "stopping": {key: simulation_params.get(key) for key in self.STOPPING_PARAMS},
+            "vectorized": self.parser_args.vectorized,
+            "islands": getattr(self.parser_args, 'islands', None),
+            "migration_interval": getattr(self.parser_args, 'migration_interval', None)})
+
+    @staticmethod
+    def _result_key(parameters_set, n_iter, fingerprint):
+        return json.dumps(parameters_set, sort_keys=True), n_iter, fingerprint
+
+    def _load_results(self):
+        '''
+        Returns:
+            dict: records already stored in the results file, by parameter set,
+                budget and config fingerprint
+        '''
+        results = {}
+        if self.parser_args.results and os.path.exists(self.parser_args.results):
+            with open(self.parser_args.results, "r") as rf:
+                for line in rf:
+                    if line.strip():
+                        record = json.loads(line)
+                        results[self._result_key(record["params"], record["n_iter"],
+                                                 record.get("fingerprint"))] = record
+        return results
+
+    def _stream(self, pool, tasks, warm_start=None):
+        '''
+        Runs (parameters_set, n_iter) tasks on the pool and yields their records
+        as they finish, appending every new record to the results file.
+        Tasks already recorded in the results file with the same config
+        fingerprint are not run again.
+        With warm_start, chains of that many consecutive tasks run in one
+        worker, each starting from the elite positions of the previous task.
+        '''
+        recorded = self._load_results()
+        fingerprint = self._fingerprint()
+        pending = []
+        for parameters_set, n_iter in tasks:
+            record = recorded.get(self._result_key(parameters_set, n_iter, fingerprint))
+            if record is None:
+                pending.append((parameters_set, n_iter))
+            else:
+                yield record
+
+        if warm_start:
+            chains = [pending[i:i + warm_start] for i in range(0, len(pending), warm_start)]
+            records = self._stream_chains(pool, chains)
+        else:
+            records = pool.imap_unordered(self._tune_process, pending, chunksize=self.parser_args.chunksize)
+        with open(self.parser_args.results, "a") if self.parser_args.results else nullcontext() as rf:
+            for record in records:
+                if rf:
+                    rf.write(json.dumps(record) + "\n")
+                    rf.flush()
+                print(f"OUTPUT STD: {record['std']}")
+                yield record
+
+    def _archive_process(self, _):
+        optimizer = self._optimizer(self.file_parameters["objective_params"])
+        _, x, _ = optimizer.optimize()
+        return x
+
+    def _processes(self):
+        max_cpus = os.cpu_count()
+        if self.parser_args.cpu == -1:
+            return max_cpus
+        if self.parser_args.cpu > max_cpus:
+            print(f"Number of cores exceeded available cpus, using maximum {max_cpus}")
+            return max_cpus
+        return self.parser_args.cpu
+
+    def _rescore(self, tune_parameters, processes):
+        '''
+        Re-scores archived positions across the whole coefficient grid instead
+        of re-optimizing every combination. Positions are optimized once with
+        the file coefficients, so this is only valid for parameters that are
+        term coefficients of the objective.
+        '''
+        parameter_sets = list(self._iter(tune_parameters))
+        for name in set().union(*parameter_sets):
+            if name not in MaximumAverageObjective.TERM_COEFFICIENTS:
+                raise ValueError(f"Parameter {name} is not a term coefficient and cannot be re-scored")
+
+        with multiprocessing.Pool(processes=processes) as pool:
+            positions = np.array(pool.map(self._archive_process, range(self.parser_args.archive_runs)))
+
+        objective = MaximumAverageObjective(**self.file_parameters["objective_params"])
+        coefficients = np.array([[parameters_set.get(name, getattr(objective, name))
+                                  for name in objective.TERM_COEFFICIENTS]
+                                 for parameters_set in parameter_sets])
+        fitness, std = sweep_scores(objective.terms(positions), coefficients)
+
+        # every combination keeps the archived position it rates highest
+        chosen = np.argmax(fitness, axis=0)
+        chosen_std = std[chosen, np.arange(len(parameter_sets))]
+        best = np.argmin(chosen_std)
+        return parameter_sets[best], chosen_std[best], positions[chosen[best]]
+
+    def _halving(self, tune_parameters, processes):
+        '''
+        Successive halving: every parameter set runs on a small iteration
+        budget, the best 1/eta of them by std survive and their budget grows
+        eta times, until the survivors run with the full n_iter budget.
+        '''
+        eta = self.parser_args.eta
+        if eta < 2:
+            raise ValueError(f"Halving needs eta >= 2 to shrink the candidates and grow the budget, got {eta}")
+        if self.parser_args.min_iter < 1:
+            raise ValueError(f"Halving needs min_iter >= 1, got {self.parser_args.min_iter}")
+        candidates = list(self._iter(tune_parameters))
+        n_iter = self.file_parameters['simulation_params']['n_iter']
+        budget = min(self.parser_args.min_iter, n_iter)
+
+        with multiprocessing.Pool(processes=processes) as pool:
+            while True:
+                results = sorted(self._stream(pool, [(params, budget) for params in candidates]),
+                                 key=lambda record: record["std"])
+                print(f"HALVING: {len(candidates)} parameter sets with {budget} iterations, best std {results[0]['std']}")
+                if budget >= n_iter:
+                    return results[0]["params"], results[0]["std"], np.array(results[0]["x"])
+                candidates = [record["params"] for record in results[:max(1, len(results) // eta)]]
+                budget = min(budget * eta, n_iter)
 
     def tune(self, tune_parameters):
         self.file_parameters = self._read_data()
         print(f"FILE PARAMETERS: {self.file_parameters}")
 
-        max_cpus = os.cpu_count()
-        if args.cpu == -1:
-            processes = max_cpus
-        elif args.cpu > max_cpus:
-            print(f"Number of cores exceeded available cpus, using maximum {max_cpus}")
-            processes = max_cpus
-        else:
-            processes = args.cpu
+        processes = self._processes()
+        if self.parser_args.strategy == "rescore":
+            return self._rescore(tune_parameters, processes)
+        if self.parser_args.strategy == "halving":
+            return self._halving(tune_parameters, processes)
 
-        manager = multiprocessing.Manager()
-        self.return_dict = manager.dict()
+        n_iter = self.file_parameters['simulation_params']['n_iter']
         with multiprocessing.Pool(processes=processes) as pool:
-            pool.map(self._tune_process, self._iter(tune_parameters))
+            best = min(self._stream(pool, ((params, n_iter) for params in self._iter(tune_parameters)),
+                                    warm_start=self.parser_args.warm_start),
+                       key=lambda record: record["std"])
 
-        return self.return_dict["max_params"], self.return_dict["min_std"], self.return_dict["max_x"]
+        return best["params"], best["std"], np.array(best["x"])
 
     def run(self):
         params = self._read_data()
-        self._simulate(MaximumAverageObjective, params['objective_params'], **params['simulation_params'])
-        plt.show()
+        processes = self._processes()
+        if self.parser_args.islands and processes > 1:
+            # pool workers are daemonic and cannot start island processes
+            print("Islands run in their own processes, epochs are simulated sequentially")
+            processes = 1
+        if self.parser_args.islands and self.parser_args.checkpoint_dir:
+            raise ValueError("Checkpoints are not supported for island colonies")
+        fitnesses, curves = self._simulate(MaximumAverageObjective, params['objective_params'], **params['simulation_params'],
+                       engine=self._engine(), cache_size=self.parser_args.cache_size,
+                       processes=processes, seed=self.parser_args.seed,
+                       profile=self.parser_args.profile_out if self.parser_args.profile else None,
+                       progress=self.parser_args.progress,
+                       progress_seconds=self.parser_args.progress_seconds,
+                       spill_curves=self.parser_args.spill_curves,
+                       checkpoint_dir=self.parser_args.checkpoint_dir,
+                       checkpoint_every=self.parser_args.checkpoint_every)
+        if not self.parser_args.no_plot:
+            simulation_params = params['simulation_params']
+            self._plot(fitnesses, curves, colony_size=simulation_params.get('colony_size', 30),
+                       n_iter=curves.n_iter, max_trials=simulation_params.get('max_trials', 100),
+                       plot_out=self.parser_args.plot_out)
 
+    @staticmethod
+    def _batch_configs(path):
+        '''
+        Returns:
+            list: json config files of a directory, or the files listed one per
+                line in a manifest, relative to the manifest
+        '''
+        if os.path.isdir(path):
+            return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".json"))
+        base = os.path.dirname(path)
+        with open(path, "r") as mf:
+            return [os.path.join(base, line.strip()) for line in mf
+                    if line.strip() and not line.lstrip().startswith("#")]
 
-if __name__ == "__main__":
+    @staticmethod
+    def _batch_spawn_key(name):
+        '''
+        Args:
+            name (str): config path relative to the batch directory or manifest
+        Returns:
+            int: spawn key of the config stream, so the results of a config do
+                not depend on the other configs of the batch; the config can be
+                rerun alone with np.random.SeedSequence(seed, spawn_key=(spawn_key,))
+        '''
+        return int(hashlib.sha256(name.encode()).hexdigest()[:8], 16)
+
+    def _batch_task(self, task):
+        '''
+        Runs one epoch or one tuning point of a batch config
+        Returns:
+            tuple: config index, task kind and its result
+        '''
+        index, kind, config, payload = task
+        simulation_params = config['simulation_params']
+        if kind == "epoch":
+            fitness, tracking, _ = self._epoch(
+                MaximumAverageObjective, config['objective_params'], payload,
+                colony_size=simulation_params.get('colony_size', 30),
+                n_iter=simulation_params.get('n_iter', 5000),
+                max_trials=simulation_params.get('max_trials', 100),
+                engine=self._engine(), cache_size=self.parser_args.cache_size,
+                stopping={key: simulation_params[key] for key in self.STOPPING_PARAMS if key in simulation_params},
+                profile=False, callbacks=self._reporters(self.parser_args.progress, self.parser_args.progress_seconds))
+            return index, kind, (fitness, tracking)
+        self.file_parameters = config
+        return index, kind, self._tune_process((payload, simulation_params['n_iter']))
+
+    @staticmethod
+    def _batch_record(state):
+        fitnesses = state["fitnesses"]
+        return {"config": state["config"], "seed": state["seed"], "spawn_key": state["spawn_key"],
+                "simulations": len(fitnesses),
+                "fitness_mean": float(np.mean(fitnesses)) if fitnesses else None,
+                "fitness_std": float(np.std(fitnesses)) if fitnesses else None,
+                "final_iteration": state["curves"].summary() if fitnesses else None,
+                "tune": state["tune"]}
+
+    def _write_batch_record(self, rf, state):
+        rf.write(json.dumps(self._batch_record(state)) + "\n")
+        rf.flush()
+        print(f"CONFIG DONE: {state['config']}")
+
+    def batch(self):
+        '''
+        Runs the epochs, and the tuning points listed under "tune_params", of
+        every config on one pool, in a single stream of tasks. A record is
+        appended to the results file as soon as every task of its config
+        has finished, configs already recorded there are skipped.
+        '''
+        files = self._batch_configs(self.parser_args.path)
+        recorded = set()
+        if os.path.exists(self.parser_args.out):
+            with open(self.parser_args.out, "r") as rf:
+                recorded = {json.loads(line)["config"] for line in rf if line.strip()}
+
+        seed_sequence = np.random.SeedSequence(self.parser_args.seed)
+        print(f"SEED: {seed_sequence.entropy}")
+        tasks, states = [], {}
+        base = self.parser_args.path if os.path.isdir(self.parser_args.path) \
+            else os.path.dirname(self.parser_args.path) or os.curdir
+        for index, file in enumerate(files):
+            if file in recorded:
+                print(f"SKIPPING RECORDED CONFIG {file}")
+                continue
+            with open(file, "r") as df:
+                config = json.load(df)
+            spawn_key = self._batch_spawn_key(os.path.relpath(file, base))
+            config_sequence = np.random.SeedSequence(seed_sequence.entropy, spawn_key=(spawn_key,))
+            simulation_params = config['simulation_params']
+            epochs = [(index, "epoch", config, stream)
+                      for stream in config_sequence.spawn(simulation_params.get('simulations', 30))]
+            points = [(index, "tune", config, params) for params in self._iter(config.get('tune_params', []))]
+            tasks += epochs + points
+            states[index] = {"config": file, "seed": seed_sequence.entropy, "spawn_key": spawn_key,
+                             "remaining": len(epochs) + len(points),
+                             "curves": CurveAggregator(simulation_params.get('n_iter', 5000)),
+                             "fitnesses": [], "tune": None}
+
+        processes = self._processes()
+        with multiprocessing.Pool(processes=processes) if processes > 1 else nullcontext() as pool, \
+             open(self.parser_args.out, "a") as rf:
+            # configs without epochs or tuning points are recorded at once, so a resume skips them
+            for state in states.values():
+                if not state["remaining"]:
+                    self._write_batch_record(rf, state)
+            results = pool.imap_unordered(self._batch_task, tasks, chunksize=self.parser_args.chunksize) \
+                if pool else map(self._batch_task, tasks)
+            for index, kind, result in results:
+                state = states[index]
+                if kind == "epoch":
+                    fitness, tracking = result
+                    state["fitnesses"].append(fitness)
+                    state["curves"].add(tracking)
+                elif state["tune"] is None or result["std"] < state["tune"]["std"]:
+                    state["tune"] = result
+                state["remaining"] -= 1
+                if not state["remaining"]:
+                    self._write_batch_record(rf, state)
+
+
+TUNE_PARAMETERS = [
+    {"avg_coeff": np.arange(50, 101, step=10),
+     "salary_coeff": [0.05, 0.5, 0.75, 1],
+     "free_time_coeff": np.arange(1, 5),
+     "coeff1": np.arange(1, 5),
+     "coeff2": np.arange(1, 5),
+     "coeff3": np.arange(1, 5)}
+]
+
+
+def build_parser():
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers(dest="command")
     run_parser = subparsers.add_parser("run")
     run_parser.add_argument('file', help='Json file with initial params')
+    run_parser.add_argument('--cpu', '-c', default=1, type=int, help="Number of cpu's used, if -1 passed all available are used")
+    run_parser.add_argument('--seed', '-s', default=None, type=int,
+                            help="Master seed, every epoch gets an independent stream derived from it")
+    run_parser.add_argument('--profile', action='store_true',
+                            help="Write per-phase timings and counters of every epoch as JSON to --profile-out")
+    run_parser.add_argument('--profile-out', default='profile.json',
+                            help="Json file the profile is written to [profile.json]")
+    run_parser.add_argument('--progress', default=None, type=int,
+                            help="Report the best solution every N iterations, silent by default")
+    run_parser.add_argument('--progress-seconds', default=None, type=float,
+                            help="Report the best solution at most every T seconds")
+    run_parser.add_argument('--vectorized', action='store_true', help="Use the vectorized whole-colony engine")
+    run_parser.add_argument('--cache-size', default=0, type=int,
+                            help="Size of the LRU fitness cache, 0 disables caching")
+    run_parser.add_argument('--plot-out', default=None,
+                            help="Write the plots to this file (.png, .svg, ...) instead of showing them")
+    run_parser.add_argument('--no-plot', action='store_true', help="Skip plotting, matplotlib is not imported")
+    run_parser.add_argument('--spill-curves', default=None,
+                            help="Write every convergence curve to this memory-mapped .npy file")
+    run_parser.add_argument('--checkpoint-dir', default=None,
+                            help="Save epoch checkpoints here, rerunning with the same --seed resumes them")
+    run_parser.add_argument('--checkpoint-every', default=None, type=int,
+                            help="Iterations between epoch checkpoints, otherwise only the final state is saved")
+    run_parser.add_argument('--islands', default=None, type=int,
+                            help="Run every epoch as this many island colonies in parallel processes")
+    run_parser.add_argument('--migration-interval', default=50, type=int,
+                            help="Iterations between ring migrations of the island best solutions [50]")
     tune_parser = subparsers.add_parser("tune")
     tune_parser.add_argument('file', help='Json file with initial params')
     tune_parser.add_argument('--cpu', '-c', default=1, type=int, help="Number of cpu's used, if -1 passed all available are used")
-    args = parser.parse_args()
+    tune_parser.add_argument('--progress', default=None, type=int,
+                             help="Report the best solution every N iterations, silent by default")
+    tune_parser.add_argument('--progress-seconds', default=None, type=float,
+                             help="Report the best solution at most every T seconds")
+    tune_parser.add_argument('--vectorized', action='store_true', help="Use the vectorized whole-colony engine")
+    tune_parser.add_argument('--cache-size', default=0, type=int,
+                             help="Size of the LRU fitness cache, 0 disables caching")
+    tune_parser.add_argument('--strategy', default="grid", choices=["grid", "rescore", "halving"],
+                             help="grid optimizes every parameter set, rescore re-scores archived positions across the grid, "
+                                  "halving runs successive halving over growing iteration budgets")
+    tune_parser.add_argument('--eta', default=2, type=int,
+                             help="Halving reduction factor, at least 2, 1/eta of the parameter sets survive each round")
+    tune_parser.add_argument('--min-iter', default=100, type=int,
+                             help="Iteration budget of the first halving round, at least 1")
+    tune_parser.add_argument('--results', '-r', default=None,
+                             help="JSONL file every tuning result is appended to, an interrupted run resumes from it")
+    tune_parser.add_argument('--chunksize', default=1, type=int,
+                             help="Number of parameter sets sent to a worker at once")
+    tune_parser.add_argument('--warm-start', default=None, type=int,
+                             help="Grid strategy: run chains of this many neighbouring parameter sets in one worker, "
+                                  "each starting from the elite positions of the previous one")
+    tune_parser.add_argument('--archive-runs', default=10, type=int,
+                             help="Number of optimizations whose positions are archived for the rescore strategy")
+    batch_parser = subparsers.add_parser("batch")
+    batch_parser.add_argument('path', help='Directory of json configs, or a manifest listing one config file per line')
+    batch_parser.add_argument('--out', '-o', default='batch.jsonl',
+                              help="Jsonl file receiving one record per config, recorded configs are skipped [batch.jsonl]")
+    batch_parser.add_argument('--cpu', '-c', default=1, type=int, help="Number of cpu's used, if -1 passed all available are used")
+    batch_parser.add_argument('--seed', '-s', default=None, type=int,
+                              help="Master seed, every config and epoch gets an independent stream derived from it")
+    batch_parser.add_argument('--progress', default=None, type=int,
+                              help="Report the best solution every N iterations, silent by default")
+    batch_parser.add_argument('--progress-seconds', default=None, type=float,
+                              help="Report the best solution at most every T seconds")
+    batch_parser.add_argument('--vectorized', action='store_true', help="Use the vectorized whole-colony engine")
+    batch_parser.add_argument('--cache-size', default=0, type=int,
+                              help="Size of the LRU fitness cache, 0 disables caching")
+    batch_parser.add_argument('--chunksize', default=1, type=int,
+                              help="Number of tasks sent to a worker at once")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
 
     simulator = Simulator(args)
 
     if args.command == "run":
         simulator.run()
     elif args.command == "tune":
-
-        parameters = [
-            {"avg_coeff": np.arange(50, 101, step=10),
-             "salary_coeff": [0.05, 0.5, 0.75, 1],
-             "free_time_coeff": np.arange(1, 5),
-             "coeff1": np.arange(1, 5),
-             "coeff2": np.arange(1, 5),
-             "coeff3": np.arange(1, 5)}
-        ]
-
-        best_params, best_std, best_position = simulator.tune(parameters)
+        best_params, best_std, best_position = simulator.tune(TUNE_PARAMETERS)
         print(f"BEST_PARAMS: {best_params} FOR STD {best_std} WITH POSITION {best_position}")
+    elif args.command == "batch":
+        simulator.batch()
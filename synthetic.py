@@ -0,0 +1,76 @@
+'''Synthetic objective instances of any dimension'''
+
+import argparse
+import json
+import numpy as np
+
+from objective import MaximumAverageObjective
+
+MIN_DIM = 10
+# share of components in the salary and satisfaction tables of the 30 dimensional instance
+TABLE_DENSITY = 8 / 30
+
+
+def synthetic_term_tables(dim, rng):
+    '''
+    Draws term tables with the structure of the default ones: the same share
+    of components in every table and coefficients drawn from the default
+    values. Components 0-3 keep their roles (study, lectures, work, social life).
+    Returns:
+        dict: JSON serializable term tables
+    '''
+    defaults = MaximumAverageObjective.DEFAULT_TERM_TABLES
+    n_terms = max(1, round(TABLE_DENSITY * dim))
+
+    def table(name, low):
+        indices = rng.choice(np.arange(low, dim), size=min(n_terms, dim - low), replace=False)
+        coefficients = rng.choice(list(defaults[name].values()), size=len(indices))
+        return {str(index): coefficient.item() for index, coefficient in zip(sorted(indices), coefficients)}
+
+    return {
+        'salary': table('salary', 4),
+        'satisfaction': table('satisfaction', 3),
+        'attendance': {'1': 1, '3': 4, str(rng.integers(4, dim)): 9},
+        'penalty': {str(rng.integers(4, dim)): 1},
+        'activity': {str(index): 1 for index in range(2, 2 + round(len(defaults['activity']) / 30 * dim))},
+    }
+
+
+def synthetic_instance(dim, objective_params, rng=None):
+    '''
+    Args:
+        dim (int): dimension of the instance, at least MIN_DIM
+        objective_params (dict): base objective parameters, e.g. of data.json
+        rng: seed or np.random.Generator of the tables
+    Returns:
+        dict: objective parameters of the instance with synthetic term tables
+            and a time budget loose enough for the samplers at any dimension:
+            td = dim*(minf + maxf + 2)/2, the mean component sum of uniform
+            samples, dim*(minf + maxf - 1)/2, plus 1.5 per component
+    '''
+    if dim < MIN_DIM:
+        raise ValueError(f"Synthetic instances need at least {MIN_DIM} dimensions, got {dim}")
+    rng = np.random.default_rng(rng)
+    params = dict(objective_params, dim=dim, term_tables=synthetic_term_tables(dim, rng))
+    # the margin grows with dim, faster than the sqrt(dim) spread of the sum,
+    # so rejection sampling stays cheap as dim grows
+    params['td'] = dim * (params.get('minf', 0) + params.get('maxf', 60) + 2) / 2
+    return params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic instance generator")
+    parser.add_argument('dim', type=int, help=f"Dimension of the instance, at least {MIN_DIM}")
+    parser.add_argument('--base', '-b', default='data.json', help='Json file the other params are copied from [data.json]')
+    parser.add_argument('--out', '-o', default=None, help="Json file the instance is written to, stdout if omitted")
+    parser.add_argument('--seed', '-s', default=None, type=int, help="Seed of the term tables")
+    pargs = parser.parse_args()
+
+    with open(pargs.base, "r") as df:
+        file_parameters = json.load(df)
+    file_parameters["objective_params"] = synthetic_instance(pargs.dim, file_parameters["objective_params"], pargs.seed)
+    if pargs.out:
+        with open(pargs.out, "w") as of:
+            json.dump(file_parameters, of, indent=2)
+    else:
+        print(json.dumps(file_parameters, indent=2))